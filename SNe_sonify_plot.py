@@ -5,6 +5,11 @@ import h5py
 import re
 from ChampagneSupernovaChords import *
 from groupdates import *
+from parsedates import *
+from sndata import readsndata, readstats, readdaybounds, findwindow, opensidecar, readdaycounts, sntypes, typecodes
+from snarrow import arrowformat, readarrowmeta, readarrow
+from mwraster import loadbackground
+from sncache import cachedirname, sessionname, loadsession, savesession
 from miditime.miditime import MIDITime
 import matplotlib.font_manager as fm
 
@@ -46,16 +51,22 @@ I felt that the different volumes were not easy to perceive as a listener and it
 This could be changed by swapping lines 553/554 below.
 '''
 
+# Attributes of the supernovae class that are cached from one session to the next (see sessionstate())
+sessionkeys = ['NsubBeats', 'tempo', 'maxDuration', 'minNstd', 'maxNstd', 'date0', 'datef', 'Ndays', 'datebins', 'binedges',
+               'beatdays', 'equalCount', 'Nframes', 'Nbeats', 'bincounts', 'mmax_mean', 'mmax_std', 'totalNSN', 'maxNSN',
+               'day0', 'dayf', 'irows', 'i0', 'i1']
+
 #====================================================================================================
-class supernovae:
+class supernovae(object):
 
 #====================================================================================================
     def __init__(self, fdata="../data/SNedata.h5", NsubBeats=4, tempo=74.80, maxDuration=2, \
-             date0=None, datef=None, minNstd=None, maxNstd=None):
+             date0=None, datef=None, minNstd=None, maxNstd=None, types=None, equalCount=0.0, usecache=True, cachedir=None):
         '''
         Inputs:
         -------
         fdata       - Filename for the SNe data (output of organizedate.py)
+                      (SNedata.h5, or its Arrow IPC/Parquet export with a '.arrow'/'.feather'/'.parquet' extension)
         NsubBeats   - Number of frames per beat, or number of sub-beats to cram into each beat (1 beat = 1 quarter note)
         tempo       - Tempo of the output song [beats per minute]
         maxDuration - Maximum duration of a note [beats (quarter notes)]
@@ -67,30 +78,57 @@ class supernovae:
 
         minNstd     - Minimum bound to use on the number of standard deviations in the maximum apparent AB magnitude
         maxNstd     - Maximum bound to use on the number of standard deviations in the maximum apparent AB magnitude
+
+        types       - List of type classifications to keep (e.g., ['Ia', 'II'])
+                      (set to None to keep all of the supernovae)
+
+        equalCount  - Blend between equal-width (0.0) and equal-count (1.0) time bins
+                      (see groupdates.groupquantile(), values in between trade some of each)
+
+        usecache    - Reuse (and cache) the setup below for the same SNe data and inputs (see sncache.py)
+        cachedir    - Directory for the cached sessions (default is 'sncache' next to fdata)
     
         Notes:
         ------
         NsubBeats and the span of [date0,datef] determines the time binning for the SNe data.
         ...Increasing (decreasing) the number of sub-beats means that the time bins will be longer (shorter).
         ...Increasing (decreasing) the [date0,datef] range means that the time bins will be longer (shorter).
+        With equalCount > 0, the time bins are shorter when there are more SNe, which caps the number of SNe in a frame
+        ...(maxNSN sets the number of tracks in sonify() and the scatter points per frame in plots()) but the frames
+        ...are no longer evenly spaced in time, so the datebins (and binedges) are the time axis for any labels.
         We are sonifying apparent magnitudes, so minNstd is bright SNe and maxNstd is dim SNe
         '''
-        # Collect the full set of organized SNe data with the initial filtering already applied
-        # ...We do not use data for: 'time', 'name', 'host', 'z'
-        f    = h5py.File(fdata, 'r')
-        date = f['date'][:]  # Discovery date
-        mmax = f['mmax'][:]  # Maximum apparent AB magnitude
-        ra   = f['ra'][:]    # Right ascension
-        dec  = f['dec'][:]   # Declination
-        l    = f['l'][:] * -1.0  # Galactic longitude <-- THINGS ARE FLIPPED W/O THE -1 FACTOR
-        b    = f['b'][:]     # Galactic latitude
-        type = f['type'][:]  # Type classification (e.g., Ia, II)
-        f.close()
+        # Reuse the setup of an earlier session with the same SNe data (by its contents) and inputs if it is cached
+        # ...Rewriting the data file or changing any of the inputs (or the chord progression) misses the cache
+        fsession = None
+        if (usecache):
+            if (cachedir == None): cachedir = cachedirname(fdata)
+            inputs   = [NsubBeats, tempo, maxDuration, date0, datef, minNstd, maxNstd, types, equalCount, chords()]
+            fsession = sessionname(fdata=fdata, inputs=inputs, cachedir=cachedir)
+            state    = loadsession(fsession=fsession)
+            if (state != None):
+                self.restore(fdata=fdata, types=types, state=state)
+                self.printstats()
+                return
+
+        # Columnar exports of the SNe data (Arrow IPC/Parquet) are read with the date/type predicates pushed down to the file
+        columnar = (arrowformat(fdata) != None)
+
+        # First and last discovery dates in the dataset (days since 1970/01/01)
+        if (columnar):
+            meta = readarrowmeta(fin=fdata)
+            firstday, lastday = meta['firstday'], meta['lastday']
+        else:
+            # Memory-map the sidecar of the SNe data if it is there (None otherwise, then everything is read from fdata)
+            # ...Nothing is copied until it is used and every process shares the same page-cached copy of the data
+            sidecar = opensidecar(fh5=fdata)
+            firstday, lastday = readdaybounds(fh5=fdata, sidecar=sidecar)
 
         # Convert the start date into a datetime object
         if (date0 == None):
             # If unspecified, set date0 to the first entry in the dataset
-            date0 = datetime.datetime.strptime(date[0], '%Y/%m/%d')
+            y0, m0, d0 = days2ymd(firstday)
+            date0 = datetime.datetime(year=int(y0), month=int(m0), day=int(d0))
         else:
             y0, m0, d0 = date0
             date0 = datetime.datetime(year=y0, month=m0, day=d0)
@@ -101,7 +139,8 @@ class supernovae:
         # Convert the end date into a datetime object
         if (datef == None):
             # If unspecified, set datef to the last entry in the dataset
-            datef = datetime.datetime.strptime(date[-1], '%Y/%m/%d')
+            yf, mf, df = days2ymd(lastday)
+            datef = datetime.datetime(year=int(yf), month=int(mf), day=int(df))
         else:
             yf, mf, df = datef
             datef = datetime.datetime(year=yf, month=mf, day=df)
@@ -110,28 +149,43 @@ class supernovae:
         Ndays = (datef - date0).days
 
         # Calculate the mean and standard deviation of the maximum apparent magnitude
-        # Note: It is important to do this before chopping the dataset because we want the std for the full dataset
-        mmax_min  = np.min(mmax)
-        mmax_max  = np.max(mmax)
-        mmax_mean = np.mean(mmax)
-        mmax_std  = np.std(mmax)
+        # Note: It is important to use the full dataset (not just the date window) because we want the std for the full dataset
+        # ...These are precomputed by organizedata.py, but older SNe data files do not have them
+        if (columnar): stats = meta
+        else: stats = readstats(fh5=fdata)
+        if (stats == None):
+            mmax  = readsndata(fh5=fdata, keys=['mmax'])['mmax']
+            stats = {'mmax_min': np.min(mmax), 'mmax_max': np.max(mmax), 'mmax_mean': np.mean(mmax), 'mmax_std': np.std(mmax)}
+        mmax_min  = stats['mmax_min']
+        mmax_max  = stats['mmax_max']
+        mmax_mean = stats['mmax_mean']
+        mmax_std  = stats['mmax_std']
         # If unspecified, calculate the min/max number of standard deviations away from the mean mmax
         if (minNstd == None): minNstd = (mmax_min - mmax_mean) / mmax_std
         if (maxNstd == None): maxNstd = (mmax_max - mmax_mean) / mmax_std
     
-        # Truncate data before the start date and after the end date
-        ikeep = []
-        for i in np.arange(len(date)):
-            thisdate = datetime.datetime.strptime(date[i], '%Y/%m/%d')
-            if ((thisdate >= date0) and (thisdate <= datef)):
-                ikeep.append(i)
-        date = date[ikeep]
-        mmax = mmax[ikeep]
-        ra   = ra[ikeep]
-        dec  = dec[ikeep]
-        l    = l[ikeep]
-        b    = b[ikeep]
-        type = type[ikeep]
+        # Locate only the organized SNe data between the start and end dates (initial filtering already applied)
+        # ...The data are sorted chronologically, so the window is a contiguous slab found with a binary search
+        # ...The columns are only read when they are first used (see column()), and only for this window
+        # ...Only keep the requested types
+        self.fdata    = fdata
+        self.columnar = columnar
+        self.sidecar  = None
+        self.day0     = datetime2days(date0)
+        self.dayf     = datetime2days(datef)
+        self.types    = types
+        self.irows    = None  # Rows of the window with the requested types (None for all of them)
+        self.i0       = None  # Rows [i0,i1) of the SNe data file in the date window (None for the columnar exports)
+        self.i1       = None
+        self.cache    = {}
+        if (not columnar):
+            self.sidecar = sidecar
+            i0, i1 = findwindow(fh5=fdata, day0=self.day0, dayf=self.dayf, sidecar=sidecar)
+            self.i0, self.i1 = i0, i1
+            if (types != None):
+                type = self.readcolumn('type')
+                self.irows = np.where(np.isin(type, types))[0]
+                self.cache['type'] = type[self.irows]
 
         # Chord progression for the song Champagne Supernova by Oasis
         chordprog = chords()
@@ -143,8 +197,26 @@ class supernovae:
         # Determine the bin size (in number of days) for the SNe data
         binsize = float(Ndays) / float(Nframes)
 
-        # Group SNe by binsize [days]
-        datebins, idatebins = groupNdays(date=date, date0=date0, datef=datef, Ndays=binsize)
+        # Group SNe by binsize [days], or into bins holding roughly equal numbers of SNe
+        # ...Equal-width bins (and their counts by type) come straight from the per-day counts in the SNe data file if it has them
+        # ...Both paths give the same bins (edgesNdays() edges, see groupNdays() for how these differ from the original loop)
+        # ...idatebins also holds the bins CSR-style (idatebins.offsets, idatebins.indices)
+        cube = None
+        if ((not columnar) and (types == None) and (equalCount <= 0)):
+            cube = readdaycounts(fh5=fdata, day0=datetime2days(date0), dayf=datetime2days(datef))
+        if (equalCount > 0):
+            datebins, idatebins = groupquantile(date=None, date0=date0, datef=datef, Nbins=Nframes, alpha=equalCount, days=self.days)
+        elif (cube != None):
+            datebins, edges    = edgesNdays(date0=date0, datef=datef, Ndays=binsize)
+            bincounts, offsets = rebincounts(edges=edges, cube=cube)
+            idatebins = csrbins(offsets=offsets - offsets[0], indices=np.arange(offsets[0], offsets[-1]) - i0, edges=edges)
+        else:
+            datebins, idatebins = groupNdays(date=None, date0=date0, datef=datef, Ndays=binsize, days=self.days)
+
+        # Days elapsed since date0 for the beat of each frame (the song plays the frames at an even pace)
+        # ...Equal-width frames start on their date bins (left edges), other frames are spread out evenly over [date0,datef]
+        if (equalCount > 0): beatdays = np.arange(Nframes) * binsize
+        else: beatdays = np.array([(datebins[i] - date0).days for i in np.arange(Nframes)])
 
         # Check that the number of number of date bins equals the number of frames we expected to have in the dataset
         Ndatebins = len(idatebins)
@@ -153,54 +225,20 @@ class supernovae:
             print "\n    ...Something unexpected happened with groupdates.groupNdays().\n"
             quit()
 
-        # Simplify the SNe classifications
-        # Types: Ia, II, Other, Unknown
-        Ntype  = len(type)
-        SNtype = [0] * Ntype
-        for i in np.arange(Ntype):
-            if (type[i] == 'Ia'):  SNtype[i] = 'Ia'
-            if (type[i] == 'II'):  SNtype[i] = 'II'
-            if (type[i] == 'nan'): SNtype[i] = 'Unknown'
-            if (SNtype[i] == 0):   SNtype[i] = 'Other'
-
-        # Number of SNe (by type) in each date bin
-        NSN      = np.zeros(Nframes)
-        NTypeIa  = np.zeros(Nframes)
-        NTypeII  = np.zeros(Nframes)
-        NOther   = np.zeros(Nframes)
-        NUnknown = np.zeros(Nframes)
-        for i in np.arange(Nframes):
-            iset   = idatebins[i]
-            Nset   = len(iset)
-            NSN[i] = Nset
-            if (Nset > 0):
-                for j in np.arange(Nset):
-                    thisType = SNtype[iset[j]]
-                    if (thisType == 'Ia'): NTypeIa[i] += 1
-                    if (thisType == 'II'): NTypeII[i] += 1
-                    if (thisType == 'Other'): NOther[i] += 1
-                    if (thisType == 'Unknown'): NUnknown[i] += 1
-
-        # Determine some useful stats and print them out
-        totalNSN    = len(date)
-        maxNSN      = int(np.max(NSN))
-        maxNTypeIa  = int(np.max(NTypeIa))
-        maxNTypeII  = int(np.max(NTypeII))
-        maxNOther   = int(np.max(NOther))
-        maxNUnknown = int(np.max(NUnknown))
-        print("\nHere are some stats...\n")
-        print "    Total number of supernovae    : ", totalNSN
-        print "    Most supernovae in a date bin : ", maxNSN
-        print "        ...Type Ia : ", maxNTypeIa
-        print "        ...Type II : ", maxNTypeII
-        print "        ...Other   : ", maxNOther
-        print "        ...Unknown : ", maxNUnknown
-        print "    Number of days in a date bin   : ", '{:.2f}'.format(binsize)
-        print "    Number of date bins (frames)   : ", Nframes
-        print "    Number of beats in the song    : ", Nbeats
-        print "    Number of sub-beats being used : ", float(Nframes) / float(Nbeats)
-        print ""
-        
+        # Number of SNe (by type) in each date bin, from a single histogram over (date bin, type)
+        # ...unless they already came from the per-day counts (then no columns need to be read at all)
+        # ...Types: Ia, II, Other, Unknown (SNcode is the index into sntypes, see the SNtype/SNcode properties)
+        Ntypes = len(sntypes)
+        if (cube == None):
+            ibin      = idatebins.binof()
+            bincounts = np.bincount(ibin * Ntypes + self.SNcode[idatebins.indices], minlength=Nframes * Ntypes).reshape(Nframes, Ntypes)
+        NSN = np.sum(bincounts, axis=1).astype(float)
+
+        # Determine some useful stats
+        if (cube != None): totalNSN = i1 - i0
+        else: totalNSN = len(self.days)
+        maxNSN = int(np.max(NSN))
+
         # Set the "self" variables that will be used later on:
         self.NsubBeats   = NsubBeats    # Number of sub-beats per beat (1 beat = 1 quarter note)
         self.tempo       = tempo        # Tempo [beats per minute]
@@ -211,20 +249,129 @@ class supernovae:
         self.datef       = datef        # Ending date (datetime object)
         self.Ndays       = Ndays        # Number of days between the start and end dates
         self.datebins    = datebins     # Date groups/bins (left edges)
+        self.binedges    = idatebins.edges  # Date bins (edges) [days since 1970/01/01], the (possibly non-linear) time axis
+        self.beatdays    = beatdays     # Days elapsed since date0 for the beat of each frame
+        self.equalCount  = equalCount   # Blend between equal-width (0.0) and equal-count (1.0) time bins
         self.idatebins   = idatebins    # Indices for the SNe belonging in each date bin
         self.Nframes     = Nframes      # Number of frames (length of idatebins, also Nbeats x NsubBeats)
         self.Nbeats      = Nbeats       # Number of beats (quarter notes) in the song
-        self.mmax        = mmax         # List of maximum apparent AB magnitudes for all SNe
-        self.ra          = ra           # List of right ascensions for all SNe
-        self.dec         = dec          # List of declinations for all SNe
-        self.l           = l            # List of Galactic longitudes for all SNe
-        self.b           = b            # List of Galactic latitudes for all SNe
-        self.SNtype      = SNtype       # List of type classifications for all SNe
+        self.bincounts   = bincounts    # Number of SNe of each type (columns in the order of sntypes) in each date bin
         self.mmax_mean   = mmax_mean    # Mean apparent magnitude for the full dataset
         self.mmax_std    = mmax_std     # Standard deviation in the apparent magnitude for the full dataset
         self.totalNSN    = totalNSN     # Total number of SNe in the dataset
         self.maxNSN      = maxNSN       # Maximum number of SNe in a single time bin
 
+        # Print out the stats and cache the setup for the next session
+        self.printstats()
+        if (fsession != None): savesession(fsession=fsession, state=self.sessionstate())
+
+        
+#====================================================================================================
+#====================================================================================================
+    # SESSION STATE
+
+    #--------------------------------------------------
+    # Print out some useful stats about the setup
+    def printstats(self):
+        maxNType = np.max(self.bincounts, axis=0)
+        print("\nHere are some stats...\n")
+        print "    Total number of supernovae    : ", self.totalNSN
+        print "    Most supernovae in a date bin : ", self.maxNSN
+        print "        ...Type Ia : ", int(maxNType[sntypes.index('Ia')])
+        print "        ...Type II : ", int(maxNType[sntypes.index('II')])
+        print "        ...Other   : ", int(maxNType[sntypes.index('Other')])
+        print "        ...Unknown : ", int(maxNType[sntypes.index('Unknown')])
+        if (self.equalCount > 0):
+            binwidths = np.diff(self.binedges)
+            print "    Number of days in a date bin   : ", '{:.2f}'.format(np.min(binwidths)), "to", '{:.2f}'.format(np.max(binwidths))
+        else:
+            print "    Number of days in a date bin   : ", '{:.2f}'.format(float(self.Ndays) / float(self.Nframes))
+        print "    Number of date bins (frames)   : ", self.Nframes
+        print "    Number of beats in the song    : ", self.Nbeats
+        print "    Number of sub-beats being used : ", float(self.Nframes) / float(self.Nbeats)
+        print ""
+
+    #--------------------------------------------------
+    # Collect the derived state of the setup to cache for the next session (see sncache.py)
+    # ...The SNe columns are not part of it (they are still read on first use), except for the type codes if they were needed
+    def sessionstate(self):
+        state = {}
+        for key in sessionkeys: state[key] = getattr(self, key)
+        state['offsets'] = self.idatebins.offsets
+        state['indices'] = self.idatebins.indices
+        state['SNcode']  = self.cache.get('SNcode')
+        return state
+
+    #--------------------------------------------------
+    # Set up from the derived state of an earlier session (output of sessionstate())
+    def restore(self, fdata, types, state):
+        for key in sessionkeys: setattr(self, key, state.get(key))
+        self.fdata     = fdata
+        self.columnar  = (arrowformat(fdata) != None)
+        self.sidecar   = None
+        if (not self.columnar): self.sidecar = opensidecar(fh5=fdata)
+        self.types     = types
+        self.idatebins = csrbins(offsets=state['offsets'], indices=state['indices'], edges=self.binedges)
+        self.cache     = {}
+        if ('SNcode' in state): self.cache['SNcode'] = state['SNcode']
+
+        
+#====================================================================================================
+#====================================================================================================
+    # LAZILY LOADED SNe DATA
+
+    #--------------------------------------------------
+    # Read one column of the SNe data in the date window (with only the requested types)
+    def readcolumn(self, key):
+        if (self.columnar):
+            return readarrow(fin=self.fdata, keys=[key], day0=self.day0, dayf=self.dayf, types=self.types)[key]
+        values = readsndata(fh5=self.fdata, keys=[key], i0=self.i0, i1=self.i1, sidecar=self.sidecar)[key]
+        if (self.irows is not None): values = values[self.irows]
+        return values
+
+    #--------------------------------------------------
+    # Collect one column of the SNe data in the date window, reading it on first use only
+    # ...A sonification never needs ra/dec/l/b and the plots never need ra/dec, so they are never read for those
+    def column(self, key):
+        if (key not in self.cache): self.cache[key] = self.readcolumn(key)
+        return self.cache[key]
+
+    @property
+    def days(self): return self.column('days')  # Discovery date [days since 1970/01/01]
+
+    @property
+    def date(self): return self.column('date')  # Discovery date
+
+    @property
+    def mmax(self): return self.column('mmax')  # List of maximum apparent AB magnitudes for all SNe
+
+    @property
+    def ra(self): return self.column('ra')      # List of right ascensions for all SNe
+
+    @property
+    def dec(self): return self.column('dec')    # List of declinations for all SNe
+
+    @property
+    def b(self): return self.column('b')        # List of Galactic latitudes for all SNe
+
+    @property
+    def l(self):
+        # List of Galactic longitudes for all SNe <-- THINGS ARE FLIPPED W/O THE -1 FACTOR
+        if ('l' not in self.cache): self.cache['l'] = self.readcolumn('l') * -1.0
+        return self.cache['l']
+
+    @property
+    def SNcode(self):
+        # Type codes (index into sntypes) for all SNe
+        if ('SNcode' not in self.cache): self.cache['SNcode'] = typecodes(self.column('type'))
+        return self.cache['SNcode']
+
+    @property
+    def SNtype(self):
+        # Array of (simplified) type classifications for all SNe
+        if ('SNtype' not in self.cache): self.cache['SNtype'] = np.array(sntypes)[self.SNcode]
+        return self.cache['SNtype']
+
         
 #====================================================================================================
 #====================================================================================================
@@ -498,9 +645,8 @@ class supernovae:
    
                 # --- BEAT --- #
 
-                # Days elapsed since the current date bin (left edge)
-                datenow     = self.datebins[i]
-                daysElapsed = (datenow - self.date0).days
+                # Days elapsed since the current date bin (left edge), or the equivalent for uneven date bins
+                daysElapsed = self.beatdays[i]
                 thisBeat    = mymidi.beat(numdays=float(daysElapsed))  # <-- Why are these not more exact???
 
                 # --- PITCH --- #
@@ -703,17 +849,15 @@ class supernovae:
         if (fmway != None):
             print("\nPlotting the Milky Way image...\n")
 
-            # Get the Milky Way data for the Hammer-Aitoff projection
-            f = h5py.File(fmway, 'r')
-            lon_grid   = f['lon_grid'][:,:]
-            lat_grid   = f['lat_grid'][:,:]
-            rgb_grid   = f['rgb_grid'][:,:]
-            colorTuple = f['colorTuple'].value
-            f.close()
-
-            # Plot the Milky Way panorama image
-            # ...kinda slow, but imshow() does not work for non-rectangular projections
-            mwax.pcolormesh(lon_grid, lat_grid*-1.0, rgb_grid[:,:,0], color=colorTuple, cmap='gray', vmin=0.0, vmax=1.0, clip_on=True, linewidth=0.0)
+            # Get the Milky Way panorama projected onto the Hammer axes as a raster of the whole figure
+            # ...pcolormesh is kinda slow (imshow() does not work for non-rectangular projections), so the raster
+            # ...is only rendered once for each figure setup and then cached on disk (see mwraster.py)
+            Nxpix, Nypix = xsize * dpi, ysize * dpi
+            background = loadbackground(fmway=fmway, Nxpix=Nxpix, Nypix=Nypix, axpos=mwax.get_position().bounds)
+
+            # Put the raster under everything else on the figure (pixel for pixel) and let it show through the axes
+            fig.figimage(background, xo=0, yo=0, origin='upper', zorder=-1)
+            mwax.patch.set_visible(False)
 
         #--------------------------------------------------
         #--------------------------------------------------
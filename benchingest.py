@@ -0,0 +1,276 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import numpy as np
+from readcatalog import readcatalog
+from reducefields import reducecatalog
+from parsedates import parsedates, days2ymd
+from skycoords import radec2galactic
+from filterbursts import findbursts, findduplicates
+from sndata import rowhashes, writesndata, sidecarname
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+'''
+Procedure:
+----------
+Benchmark each stage of the ingest done by organizedata.py on synthetic Open Supernova Catalogs
+of increasing size (10k to 10M rows by default).
+
+Output:
+-------
+A table of the time [seconds], throughput [rows/s], and peak memory [MB] of each stage for each catalog size.
+
+Notes:
+------
+The synthetic catalogs have the same columns as the real CSV export, including multi-valued fields
+(e.g., "SN2011fe,PTF11kly"), missing values, and malformed dates (e.g., "yyyy/mm"), in about the same
+proportions as the real catalog. The stages are run the same way organizedata.py runs them.
+The peak memory of each stage is measured with tracemalloc (Python 3), which tracks numpy arrays too,
+in a second pass over the stages because tracing slows them down too much to time them at the same time.
+The peak resident memory of the whole process is reported at the end.
+Usage: python benchingest.py [--nomemory] [Nrows1 Nrows2 ...]
+'''
+
+# Catalog sizes to benchmark
+Nrows_list = [10000, 100000, 1000000, 10000000]
+
+# Columns in the Open Supernova Catalog CSV export
+oscheader = ['Name', 'Disc. Date', 'mmax', 'Host Name', 'R.A.', 'Dec.', 'z', 'Type', 'Phot.', 'Spec.', 'Radio', 'X-ray']
+
+#====================================================================================================
+# Write a synthetic Open Supernova Catalog CSV file
+def makecatalog(fcsv, Nrows, seed=0, Nchunk=100000):
+    '''
+    Inputs:
+    -------
+    fcsv   - Filename for the synthetic catalog
+    Nrows  - Number of supernovae in the catalog
+    seed   - Seed for the random number generator
+    Nchunk - Number of rows to generate at a time
+
+    Outputs:
+    --------
+    A CSV file in the same format as The_Open_Supernova_Catalog.csv
+    '''
+    rng  = np.random.RandomState(seed)
+    fout = open(fcsv, 'w')
+    fout.write(','.join(['"' + col + '"' for col in oscheader]) + '\n')
+    for i0 in np.arange(0, Nrows, Nchunk):
+        N = min(Nchunk, Nrows - i0)
+
+        # Names, some with aliases
+        name = np.char.add('SN', (i0 + np.arange(N)).astype(str))
+        name = np.where(rng.rand(N) < 0.1, np.char.add(name, np.char.add(',PS', np.arange(N).astype(str))), name)
+
+        # Discovery dates, some partial, some missing
+        year  = rng.randint(1885, 2019, N)
+        month = rng.randint(1, 13, N)
+        day   = rng.randint(1, 29, N)
+        date  = np.char.add(np.char.add(np.char.zfill(year.astype(str), 4), '/'), np.char.zfill(month.astype(str), 2))
+        full  = rng.rand(N) > 0.05
+        date  = np.where(full, np.char.add(np.char.add(date, '/'), np.char.zfill(day.astype(str), 2)), date)
+        date  = np.where(rng.rand(N) < 0.02, '', date)
+
+        # Apparent magnitudes, some missing, some with multiple entries
+        mmax = np.char.mod('%.2f', rng.uniform(8.0, 23.0, N))
+        mmax = np.where(rng.rand(N) < 0.05, np.char.add(np.char.add(mmax, ','), mmax), mmax)
+        mmax = np.where(rng.rand(N) < 0.3, '', mmax)
+
+        # Host galaxies, some missing, some with aliases
+        host = np.char.add('NGC ', rng.randint(1, 8000, N).astype(str))
+        host = np.where(rng.rand(N) < 0.1, np.char.add(host, ',UGC 1'), host)
+        host = np.where(rng.rand(N) < 0.4, '', host)
+
+        # RA/DEC strings, some missing, some with multiple entries
+        rah  = rng.randint(0, 24, N)
+        ram  = rng.randint(0, 60, N)
+        ras  = rng.uniform(0.0, 59.999, N)
+        ra   = np.char.mod('%02d:', rah)
+        ra   = np.char.add(np.char.add(ra, np.char.mod('%02d:', ram)), np.char.zfill(np.char.mod('%.3f', ras), 6))
+        ra   = np.where(rng.rand(N) < 0.05, np.char.add(np.char.add(ra, ','), ra), ra)
+        ra   = np.where(rng.rand(N) < 0.03, '', ra)
+        decd = rng.randint(-89, 90, N)
+        decm = rng.randint(0, 60, N)
+        decs = rng.uniform(0.0, 59.99, N)
+        dec  = np.where(decd < 0, '-', '+')
+        dec  = np.char.add(np.char.add(dec, np.char.mod('%02d:', np.abs(decd))), np.char.mod('%02d:', decm))
+        dec  = np.char.add(dec, np.char.zfill(np.char.mod('%.2f', decs), 5))
+        dec  = np.where(rng.rand(N) < 0.03, '', dec)
+
+        # Redshifts and types, some missing, some with multiple entries
+        z    = np.char.mod('%.4f', rng.uniform(0.0, 1.0, N))
+        z    = np.where(rng.rand(N) < 0.05, np.char.add(np.char.add(z, ','), z), z)
+        z    = np.where(rng.rand(N) < 0.5, '', z)
+        type = np.array(['Ia', 'II', 'IIn', 'Ib', 'Ic', 'Ib/c', 'IIP', 'Ia,Ia-pec', 'Candidate', ''])[rng.randint(0, 10, N)]
+
+        # Photometry/spectra/radio/X-ray counts
+        phot = np.where(rng.rand(N) < 0.5, '', rng.randint(1, 500, N).astype(str))
+        spec = np.where(rng.rand(N) < 0.7, '', rng.randint(1, 20, N).astype(str))
+
+        cols = [name, date, mmax, host, ra, dec, z, type, phot, spec]
+        rows = np.char.add('"', cols[0])
+        for col in cols[1:]:
+            rows = np.char.add(np.char.add(rows, '","'), col)
+        fout.write('\n'.join(np.char.add(rows, '","",""')) + '\n')
+    fout.close()
+
+
+#====================================================================================================
+# Run each stage of the ingest on a catalog, timing it and measuring its peak memory
+def benchstages(fcsv, fh5, trace=False):
+    '''
+    Inputs:
+    -------
+    fcsv  - Filename for the (synthetic) Open Supernova Catalog
+    fh5   - Filename for the output HDF5 file
+    trace - Measure the peak memory of each stage with tracemalloc (this slows down the stages a lot)
+
+    Outputs:
+    --------
+    stages - List of (stage name, time [seconds], peak memory [MB], number of rows into the stage)
+    '''
+    stages = []
+    state  = {}
+
+    def runstage(stagename, Nin, func):
+        if (trace):
+            tracemalloc.start()
+        t0 = time.time()
+        func()
+        dt = time.time() - t0
+        peak = np.nan
+        if (trace):
+            peak = tracemalloc.get_traced_memory()[1] / 1.0e6
+            tracemalloc.stop()
+        stages.append((stagename, dt, peak, Nin))
+
+    def read():
+        state['table'] = readcatalog(fcsv=fcsv, dtypes={})
+    def fingerprint():
+        state['rowhash'] = rowhashes(table=state['table'])
+    def split():
+        state['table'] = reducecatalog(table=state['table'], fieldreducers={})
+    def dateparse():
+        state['days'], state['time'], state['gooddate'] = parsedates(date=state['table']['Disc. Date'])
+    def filterrows():
+        table = state['table']
+        year  = days2ymd(state['days'])[0]
+        igood = np.where(state['gooddate'] & ~np.isnan(table['R.A.']) & ~np.isnan(table['Dec.']) & (year < 2018) & (year >= 1900))[0]
+        for key in ['days', 'time', 'rowhash']: state[key] = state[key][igood]
+        for col in table.keys(): table[col] = table[col][igood]
+    def bursts():
+        table = state['table']
+        burst = findbursts(days=state['days'], ra=table['R.A.'], dec=table['Dec.'])[0]
+        burst = burst | findduplicates(days=state['days'], ra=table['R.A.'], dec=table['Dec.'])
+        state['Nrejected'] = int(np.sum(burst))
+    def sort():
+        table = state['table']
+        isort = np.argsort(state['time'])
+        for key in ['days', 'time', 'rowhash']: state[key] = state[key][isort]
+        for col in table.keys(): table[col] = table[col][isort]
+    def nanfill():
+        mmax = state['table']['mmax']
+        state['mmax_filled'] = np.isnan(mmax)
+        mmax[state['mmax_filled']] = np.nanmean(mmax)
+    def coords():
+        table = state['table']
+        state['coords'] = radec2galactic(ra=table['R.A.'], dec=table['Dec.'], unit='deg')
+    def write():
+        table = state['table']
+        data  = {'time': state['time'], 'days': state['days'], 'name': table['Name'], 'date': table['Disc. Date'],
+                 'mmax': table['mmax'], 'host': table['Host Name'], 'z': table['z'], 'type': table['Type'],
+                 'mmax_filled': state['mmax_filled'], 'rowhash': state['rowhash']}
+        data['ra'], data['dec'], data['l'], data['b'] = state['coords']
+        # Start from scratch (including the sidecar of the packed records, which writesndata() writes next to fh5)
+        for fout in [fh5, sidecarname(fh5)]:
+            if (os.path.exists(fout)): os.remove(fout)
+        writesndata(fh5=fh5, data=data)
+
+    Nrows = lambda: len(state['table']['Name'])
+    runstage('read', None, read)
+    Nread = Nrows()
+    runstage('fingerprint', Nread, fingerprint)
+    runstage('first-entry split', Nread, split)
+    runstage('date parse', Nread, dateparse)
+    runstage('filter', Nread, filterrows)
+    Ngood = Nrows()
+    runstage('bursts/duplicates', Ngood, bursts)
+    runstage('sort', Ngood, sort)
+    runstage('NaN fill', Ngood, nanfill)
+    runstage('coordinate transform', Ngood, coords)
+    runstage('HDF5 write', Ngood, write)
+
+    # The read stage produces (rather than consumes) the rows
+    stages[0] = stages[0][:3] + (Nread,)
+    return stages
+
+
+#====================================================================================================
+# Peak resident memory of this process so far [MB]
+def peakrss():
+    '''
+    Outputs:
+    --------
+    Peak resident set size [MB] (NaN if it cannot be measured on this platform)
+    '''
+    try:
+        import resource
+    except ImportError:
+        return np.nan
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if (sys.platform == 'darwin'): return maxrss / 1.0e6  # Bytes on macOS
+    return maxrss / 1.0e3  # Kilobytes on Linux
+
+
+#====================================================================================================
+# Benchmark the ingest stages over a range of catalog sizes
+def benchmark(Nrows_list=Nrows_list, workdir=None, seed=0, memory=True):
+    '''
+    Inputs:
+    -------
+    Nrows_list - List of catalog sizes (number of rows)
+    workdir    - Directory for the synthetic catalogs and output files (default is a temporary directory)
+    seed       - Seed for the random number generator
+    memory     - Measure the peak memory of each stage (requires tracemalloc, doubles the run time)
+
+    Outputs:
+    --------
+    results - Dictionary of the stages for each catalog size (see benchstages())
+    '''
+    cleanup = (workdir == None)
+    if (cleanup): workdir = tempfile.mkdtemp(prefix='benchingest')
+    results = {}
+    for Nrows in Nrows_list:
+        fcsv = os.path.join(workdir, 'synthetic_%d.csv' % Nrows)
+        fh5  = os.path.join(workdir, 'synthetic_%d.h5' % Nrows)
+        t0 = time.time()
+        makecatalog(fcsv=fcsv, Nrows=Nrows, seed=seed)
+        print("\nSynthetic catalog with %d rows (%.1f MB, generated in %.1f seconds)" % (Nrows, os.path.getsize(fcsv) / 1.0e6, time.time() - t0))
+
+        stages = benchstages(fcsv=fcsv, fh5=fh5)
+        if (memory and (tracemalloc != None)):
+            peaks  = [stage[2] for stage in benchstages(fcsv=fcsv, fh5=fh5, trace=True)]
+            stages = [stage[:2] + (peak,) + stage[3:] for stage, peak in zip(stages, peaks)]
+        results[Nrows] = stages
+        print("    %-22s %10s %14s %12s" % ('Stage', 'Time [s]', 'Rows/s', 'Peak [MB]'))
+        for stagename, dt, peak, Nin in stages:
+            print("    %-22s %10.3f %14.0f %12.1f" % (stagename, dt, Nin / max(dt, 1.0e-9), peak))
+        ttot = sum([stage[1] for stage in stages])
+        print("    %-22s %10.3f %14.0f" % ('total', ttot, Nrows / ttot))
+        print("    HDF5 file size: %.1f MB, peak resident memory so far: %.0f MB" % (os.path.getsize(fh5) / 1.0e6, peakrss()))
+        for fout in [fcsv, fh5, sidecarname(fh5)]:
+            if (os.path.exists(fout)): os.remove(fout)
+    if (cleanup): shutil.rmtree(workdir)
+    return results
+
+
+if __name__ == "__main__":
+    memory = ('--nomemory' not in sys.argv)
+    args   = [arg for arg in sys.argv[1:] if (arg != '--nomemory')]
+    if (len(args) > 0): Nrows_list = [int(float(arg)) for arg in args]
+    benchmark(Nrows_list=Nrows_list, memory=memory)
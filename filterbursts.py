@@ -0,0 +1,163 @@
+import numpy as np
+from parsedates import days2ymd
+
+'''
+Procedure:
+----------
+Find the bogus "bursts" of discoveries (e.g., 200+ discovered in one day in the Galactic plane?!)
+and the exact duplicate entries in the catalog.
+
+Output:
+-------
+Boolean masks of the burst members and duplicates, plus a report of the rejected entries.
+
+Notes:
+------
+Every supernova is given an integer key for its (discovery day, sky cell), where the sky cells are
+bands of declination split into RA cells of (roughly) equal area. Counting the supernovae that share
+a key is then a single np.unique() on an integer array, so there are no pairwise comparisons.
+
+A (day, cell) is a burst when it has at least Nmin supernovae and more than nsigma Poisson standard
+deviations above the expected count, which is the average daily count for that cell over the same year.
+Duplicates share a discovery day and have the same RA/DEC to within dupsize [arcseconds];
+the first one in the catalog is kept.
+
+Both tests depend on every other supernova (in the same day/year, and earlier in the catalog), so screen()
+has to see all of the supernovae in catalog order. In incremental mode organizedata.py gets the ones it
+already screened from the screening ledger of the SNe data file (see sndata.writescreen()).
+'''
+
+# Outcomes of the screening (the codes stored in the screening ledger)
+# ...'filtered' is for the catalog rows that organizedata.py filtered out before the screening (e.g., no RA/DEC)
+screenreasons = ['kept', 'burst', 'duplicate', 'filtered']
+
+#====================================================================================================
+# Assign each RA/DEC to a cell of (roughly) equal area on the sky
+def skycells(ra, dec, cellsize=2.0):
+    '''
+    Inputs:
+    -------
+    ra, dec  - Arrays of RA/DEC [degrees]
+    cellsize - Height of the declination bands (and width of the RA cells at the equator) [degrees]
+
+    Outputs:
+    --------
+    cell - Array of integer cell numbers
+    '''
+    ra   = np.asarray(ra, dtype=np.float64) % 360.0
+    dec  = np.clip(np.asarray(dec, dtype=np.float64), -90.0, 90.0)
+    Nband = int(np.ceil(180.0 / cellsize))
+    Nmax  = int(np.ceil(360.0 / cellsize))
+
+    # Number of RA cells in each declination band shrinks towards the poles
+    iband = np.minimum(((dec + 90.0) / cellsize).astype(np.int64), Nband - 1)
+    decmid = -90.0 + (np.arange(Nband) + 0.5) * cellsize
+    Nra    = np.maximum(np.round(Nmax * np.cos(np.radians(decmid))), 1).astype(np.int64)
+    ira    = np.minimum((ra / 360.0 * Nra[iband]).astype(np.int64), Nra[iband] - 1)
+    return iband * Nmax + ira
+
+
+#====================================================================================================
+# Flag the supernovae belonging to implausible bursts of discoveries
+def findbursts(days, ra, dec, cellsize=2.0, Nmin=10, nsigma=5.0):
+    '''
+    Inputs:
+    -------
+    days     - Array of discovery day numbers (days since 1970/01/01)
+    ra, dec  - Arrays of RA/DEC [degrees]
+    cellsize - Size of the sky cells [degrees] (see skycells())
+    Nmin     - Smallest number of supernovae in a (day, cell) that can be a burst
+    nsigma   - Number of Poisson standard deviations above the expected count for a burst
+
+    Outputs:
+    --------
+    burst, Ncell - Boolean mask of the burst members, Number of supernovae sharing each one's (day, cell)
+    '''
+    days = np.asarray(days, dtype=np.int64)
+    if (len(days) == 0): return np.zeros(0, dtype=bool), np.zeros(0, dtype=np.int64)
+    cell  = skycells(ra=ra, dec=dec, cellsize=cellsize)
+    Ncells = int(cell.max()) + 1
+    year  = days2ymd(days)[0]
+
+    # Number of supernovae in each (day, cell) and in each (year, cell)
+    Ncell = np.unique(days * Ncells + cell, return_inverse=True, return_counts=True)
+    Ncell = Ncell[2][Ncell[1].ravel()]
+    Nyear = np.unique(year * Ncells + cell, return_inverse=True, return_counts=True)
+    Nyear = Nyear[2][Nyear[1].ravel()]
+
+    # Expected daily count for the cell (leaving out the day itself), and the Poisson threshold above it
+    expected = (Nyear - Ncell) / 365.25
+    burst    = (Ncell >= Nmin) & (Ncell > expected + nsigma * np.sqrt(np.maximum(expected, 1.0 / 365.25)))
+    return burst, Ncell
+
+
+#====================================================================================================
+# Flag the exact duplicate entries (same day, same RA/DEC), keeping the first one
+def findduplicates(days, ra, dec, dupsize=1.0):
+    '''
+    Inputs:
+    -------
+    days    - Array of discovery day numbers (days since 1970/01/01)
+    ra, dec - Arrays of RA/DEC [degrees]
+    dupsize - Positions closer than this (on a grid) are the same [arcseconds]
+
+    Outputs:
+    --------
+    duplicate - Boolean mask of the duplicates (the first entry of each group is not flagged)
+    '''
+    days = np.asarray(days, dtype=np.int64)
+    if (len(days) == 0): return np.zeros(0, dtype=bool)
+    ira  = np.round((np.asarray(ra) % 360.0) * 3600.0 / dupsize).astype(np.int64)
+    idec = np.round((np.asarray(dec) + 90.0) * 3600.0 / dupsize).astype(np.int64)
+    Nra  = int(np.round(360.0 * 3600.0 / dupsize)) + 1
+    Ndec = int(np.round(180.0 * 3600.0 / dupsize)) + 1
+    key  = (days * Ndec + idec) * Nra + ira
+    ifirst = np.unique(key, return_index=True)[1]
+    duplicate = np.ones(len(days), dtype=bool)
+    duplicate[ifirst] = False
+    return duplicate
+
+
+#====================================================================================================
+# Screen the supernovae for bursts of discoveries and duplicates
+def screen(days, ra, dec):
+    '''
+    Inputs:
+    -------
+    days    - Array of discovery day numbers (days since 1970/01/01), in catalog order
+    ra, dec - Arrays of RA/DEC [degrees]
+
+    Outputs:
+    --------
+    reason, Ncell - Array of the outcomes (uint8 index into screenreasons), Number of supernovae sharing each one's (day, cell)
+    '''
+    burst, Ncell = findbursts(days=days, ra=ra, dec=dec)
+    duplicate = findduplicates(days=days, ra=ra, dec=dec) & ~burst
+    reason = np.zeros(len(burst), dtype=np.uint8)
+    reason[burst]     = screenreasons.index('burst')
+    reason[duplicate] = screenreasons.index('duplicate')
+    return reason, Ncell
+
+
+#====================================================================================================
+# Write out a report of the rejected supernovae
+def writereport(freport, name, date, ra, dec, reason, Ncell=None):
+    '''
+    Inputs:
+    -------
+    freport        - Filename for the report
+    name, date     - Arrays of the rejected supernovae names and discovery dates
+    ra, dec        - Arrays of the rejected supernovae RA/DEC [degrees]
+    reason         - Array of the reasons for rejecting each supernova (e.g., 'burst', 'duplicate')
+    Ncell          - Array of the number of supernovae in each one's (day, cell)
+
+    Outputs:
+    --------
+    A text file with one line per rejected supernova
+    '''
+    if (Ncell is None): Ncell = np.zeros(len(name), dtype=np.int64)
+    fout = open(freport, 'w')
+    fout.write("# %-23s %-12s %12s %12s %-10s %s\n" % ('Name', 'Date', 'RA [deg]', 'DEC [deg]', 'Reason', 'N(day,cell)'))
+    for i in np.arange(len(name)):
+        fout.write("%-25s %-12s %12.6f %12.6f %-10s %d\n" % (name[i], date[i], ra[i], dec[i], reason[i], Ncell[i]))
+    fout.close()
@@ -1,80 +1,342 @@
+import time
 import numpy as np
 import datetime
+from parsedates import parsedates, datetime2days
 
 '''
 Procedure:
 ----------
-Bin supernovae data by day (or month) increments.
+Bin supernovae data by day increments, by calendar units (month, quarter, year, ISO week),
+or into bins holding roughly equal numbers of supernovae.
+
+Output:
+-------
+Date bins (edges) and the indices of the supernovae in each bin, stored CSR-style: the indices of the
+supernovae in bin i are indices[offsets[i]:offsets[i+1]] (see the csrbins class).
 
 Notes:
 ------
 Use groupNdays() for production, while groupmonth() was used in the initial/testing phases.
-These routines may be a bit sloppy, but they get the job done.
+groupcalendar() bins by calendar units: the edges are found with datetime64 month arithmetic (or in steps of
+7 days for ISO weeks), and the supernovae are assigned to bins the same way as in groupNdays().
+rebincounts() gives the number of supernovae of each type in any bins straight from the per-day counts stored
+in the SNe data file, without the dates themselves, so different bin sizes can be tried out instantly.
+groupquantile() spaces the bin edges by the cumulative number of supernovae instead of by time (or a blend of
+the two), which caps the number of supernovae in the busiest bins at the cost of a non-linear time axis.
+groupNdays() works on integer day numbers (days since 1970/01/01, see parsedates.py): the bin edges are
+computed arithmetically and the supernovae are assigned to bins with np.searchsorted, so binning millions of
+supernovae into tens of thousands of bins takes milliseconds. When the days are sorted (as they are in the
+SNe data file), the bins are contiguous runs and only the bin edges need to be searched for.
 '''
 
 #====================================================================================================
-# Group dates by number of days (fractional days are acceptable)
-def groupNdays(date, date0, datef, Ndays):
+class csrbins(object):
+    '''
+    Indices of the supernovae in each bin (CSR layout), indexed like the old list of lists
+    (bins[i] is an array of indices, bins[i0:i1] is a list of arrays, len(bins) is the number of bins)
+
+    Inputs:
+    -------
+    offsets - Start of each bin in indices (length is the number of bins + 1)
+    indices - Indices of the supernovae, bin by bin
+    edges   - Bin edges [days since 1970/01/01] (length is the number of bins + 1)
+    '''
+    def __init__(self, offsets, indices, edges=None):
+        self.offsets = offsets
+        self.indices = indices
+        self.edges   = edges
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if (isinstance(i, slice)): return [self[j] for j in range(*i.indices(len(self)))]
+        if (i < 0): i = i + len(self)
+        if ((i < 0) or (i >= len(self))): raise IndexError("Bin index out of range")
+        return self.indices[self.offsets[i]:self.offsets[i+1]]
+
+    def __iter__(self):
+        for i in range(len(self)): yield self[i]
+
+    # Number of supernovae in each bin
+    def counts(self):
+        return np.diff(self.offsets)
+
+    # Bin of each of the supernovae in indices
+    def binof(self):
+        return np.repeat(np.arange(len(self)), self.counts())
+
+    # Plain list of lists of the indices (e.g., [[0,1,2,3],[4,5],[6,7,8,9]])
+    def tolists(self):
+        return [list(iset) for iset in self]
+
+
+#====================================================================================================
+# Assign day numbers to bins
+def assignbins(days, edges):
+    '''
+    Inputs:
+    -------
+    days  - Day numbers of the supernovae [days since 1970/01/01]
+    edges - Increasing bin edges [days since 1970/01/01], bin i is [edges[i], edges[i+1])
+
+    Outputs:
+    --------
+    offsets, indices - CSR layout of the supernovae in each bin (supernovae outside of the edges are left out)
+    '''
+    days  = np.asarray(days)
+    edges = np.asarray(edges, dtype=np.float64)
+    Nbins = len(edges) - 1
+
+    # Sorted days: each bin is a contiguous run of supernovae, so only the edges need to be searched for
+    # ...(integer days are >= an edge exactly when they are >= its ceiling, which avoids casting days to floats)
+    if ((len(days) < 2) or np.all(days[1:] >= days[:-1])):
+        if (days.dtype.kind in 'iu'): offsets = np.searchsorted(days, np.ceil(edges).astype(days.dtype), side='left')
+        else: offsets = np.searchsorted(days, edges, side='left')
+        indices = np.arange(offsets[0], offsets[-1])
+        return offsets - offsets[0], indices
+
+    # Unsorted days: find the bin of each supernova, then group the supernovae by bin (keeping their order)
+    ibin    = np.searchsorted(edges, days, side='right') - 1
+    inside  = (ibin >= 0) & (ibin < Nbins)
+    ibin    = ibin[inside]
+    offsets = np.zeros(Nbins + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(np.bincount(ibin, minlength=Nbins))
+    indices = np.nonzero(inside)[0][np.argsort(ibin, kind='stable')]
+    return offsets, indices
+
+
+#====================================================================================================
+# Bin edges every Ndays days (fractional days are acceptable)
+def edgesNdays(date0, datef, Ndays):
     '''
     Inputs:
     -------
-    date  - List of ordered dates in "yyyy/mm/dd" string format
     date0 - Starting date in format of a datetime.datetime() object
     datef - Ending date in format of a datetime.datetime() object
-    Ndays - Bin size for grouping the data (can be a non-integer)
-    
+    Ndays - Bin size (can be a non-integer)
+
     Outputs:
     --------
-    datebins, iNdays - Date bins (edges), Indices of input date array within each bin
-    '''
-    # Initializations
-    Ndates   = len(date)
-    datemin  = date0
-    datebins = []  # Output date bins
-    iNdays   = []  # Output date indices belonging to each bin
-    j = 0
-    
+    datebins, edges - Date bins (edges, datetime.datetime() objects), Bin edges [days since 1970/01/01]
+    '''
     # Determine the number of bins
     Nbins = int((datef - date0).days / float(Ndays))
 
-    # Initial date in the dataset
-    datenow = datetime.datetime.strptime(date[0], '%Y/%m/%d')
+    # The steps are whole microseconds (like datetime.timedelta), so edges that fall on a day are exact
+    usteps   = np.round(np.arange(Nbins + 1) * float(Ndays) * 86400.0e6).astype(np.int64)
+    edges    = datetime2days(date0) + (usteps // 86400000000) + (usteps % 86400000000) / 86400.0e6
+    datebins = [date0 + datetime.timedelta(microseconds=int(ustep)) for ustep in usteps]
+    return datebins, edges
 
-    # Loop through each date bin, collect the relevant supernovae
-    for i in np.arange(Nbins):
 
-        # Append datemin to the bins list
-        datebins.append(datemin)
+#====================================================================================================
+# Number of supernovae (of each type) in each bin from the per-day counts (see sndata.readdaycounts())
+def rebincounts(edges, cube):
+    '''
+    Inputs:
+    -------
+    edges - Increasing bin edges [days since 1970/01/01], bin i is [edges[i], edges[i+1])
+    cube  - Per-day counts and offsets (output of sndata.readdaycounts(), covering the edges)
+
+    Outputs:
+    --------
+    counts, offsets - Number of supernovae of each type in each bin [Nbins, Ntypes],
+                      Index (into the SNe data file) of the first supernova in each bin, plus the end [Nbins+1]
 
-        # Bounding end date for the current bin
-        datemax = datemin + datetime.timedelta(days=Ndays)
+    Notes:
+    ------
+    Supernovae are discovered on whole days, so bin i holds the days ceil(edges[i]) through ceil(edges[i+1]) - 1,
+    and the counts are differences of the cumulative per-day counts (O(Nbins) once the cumulative sums are made).
+    These are the same bins as assignbins() gives for the same edges (e.g., the edgesNdays() edges of groupNdays()).
+    '''
+    Ndays  = cube['counts'].shape[0]
+    cumsum = np.zeros((Ndays + 1, cube['counts'].shape[1]), dtype=np.int64)
+    cumsum[1:] = np.cumsum(cube['counts'], axis=0)
+    iday    = np.clip(np.ceil(np.asarray(edges, dtype=np.float64)).astype(np.int64) - cube['day0'], 0, Ndays)
+    counts  = np.diff(cumsum[iday], axis=0)
+    offsets = cube['offsets'][iday]
+    return counts, offsets
 
-        # Initialize the list for this date bin
-        thisbin = []
 
-        # Collect the supernovae belonging to the current date bin
-        while ((datenow >= datemin) and (datenow < datemax) and (j < Ndates)):
-            
-            # Add the SN to this date bin
-            thisbin.append(j)
-            
-            # Move on to the next supernova
-            j = j + 1
-            if (j < Ndates):
-                datenow = datetime.datetime.strptime(date[j], '%Y/%m/%d')
+#====================================================================================================
+# Group dates by number of days (fractional days are acceptable)
+def groupNdays(date, date0, datef, Ndays, days=None):
+    '''
+    Inputs:
+    -------
+    date  - List of ordered dates in "yyyy/mm/dd" string format (not used if days is given)
+    date0 - Starting date in format of a datetime.datetime() object
+    datef - Ending date in format of a datetime.datetime() object
+    Ndays - Bin size for grouping the data (can be a non-integer)
+    days  - Day numbers of the dates [days since 1970/01/01] (None to parse them from date)
     
-        # Add thisbin to the master list
-        iNdays.append(thisbin)
+    Outputs:
+    --------
+    datebins, iNdays - Date bins (edges, datetime.datetime() objects), Indices of input date array within each bin
+                       (a csrbins object, which also holds the offsets/indices/edges arrays)
+
+    Notes:
+    ------
+    The bins are not always identical to the ones of the original loop, which added datetime.timedelta(days=Ndays)
+    to the previous edge: that rounds Ndays to a whole microsecond and the rounding accumulates from bin to bin.
+    Here edge i is date0 + i*Ndays rounded once (see edgesNdays()), so an edge that should fall on midnight does.
+    The old edges drifted up to a millisecond or so past midnight, which put the supernovae of that day in the
+    earlier bin, whereas they now go to the later bin (bin i is [edges[i], edges[i+1])). Only a few frames change,
+    e.g., a handful of the 2064 bins for 1990-2000 with Ndays = 3652/2064 (the pairs of bins around those edges).
+    '''
+    # Parse all of the dates into day numbers at once
+    if (days is None): days = parsedates(date=date)[0]
 
-        # datemax becomes the new datemin
-        datemin = datemax
+    # Bin edges, then the supernovae belonging to each bin
+    datebins, edges  = edgesNdays(date0=date0, datef=datef, Ndays=Ndays)
+    offsets, indices = assignbins(days=days, edges=edges)
 
-    # Append the final datemax to the bins list
-    datebins.append(datemax)
+    # We now have the supernova grouped by Ndays
+    # ...e.g., iNdays[0] = [0,1,2,3], iNdays[1] = [4,5], iNdays[2] = [6,7,8,9]...
+    return datebins, csrbins(offsets=offsets, indices=indices, edges=edges)
 
-    # We now have the supernova in a list of lists grouped by Ndays
-    # ...e.g., iNdays = [[0,1,2,3],[4,5],[6,7,8,9]]...
-    return datebins, iNdays
+
+#====================================================================================================
+# Bin edges that blend equal-width (alpha = 0) and equal-count (alpha = 1) bins
+def quantileedges(days, day0, Ndays, Nbins, alpha=1.0):
+    '''
+    Inputs:
+    -------
+    days  - Day numbers of the supernovae [days since 1970/01/01]
+    day0  - Left edge of the first bin [days since 1970/01/01]
+    Ndays - Span of all of the bins [days] (the right edge of the last bin is day0 + Ndays)
+    Nbins - Number of bins
+    alpha - Exponent on the daily number of supernovae used to weight time (0 for equal-width bins,
+            1 for bins holding roughly equal numbers of supernovae, and in between for a blend)
+
+    Outputs:
+    --------
+    edges - Increasing bin edges [days since 1970/01/01] (float64), bin i is [edges[i], edges[i+1])
+
+    Notes:
+    ------
+    Each day is weighted by (number of supernovae that day + floor)^alpha, where the small floor keeps the empty
+    stretches from collapsing to nothing, and the edges split the cumulative weight evenly (linearly
+    interpolated within a day). The supernovae of a single day always land in the same bin, so a day with more
+    discoveries than the target number per bin makes that bin larger.
+    '''
+    Nspan = int(np.ceil(Ndays))
+    iday  = np.floor(np.asarray(days, dtype=np.float64) - np.floor(day0)).astype(np.int64)
+    iday  = iday[(iday >= 0) & (iday < Nspan)]
+    Nday  = np.bincount(iday, minlength=Nspan).astype(np.float64)
+
+    # Cumulative weight at the start of each day, split evenly into Nbins
+    floor  = 1.0e-3 * max(np.mean(Nday), 1.0)
+    weight = np.concatenate([[0.0], np.cumsum((Nday + floor)**alpha)])
+    levels = weight[-1] * np.arange(Nbins + 1) / float(Nbins)
+    edges  = np.floor(day0) + np.interp(levels, weight, np.arange(Nspan + 1, dtype=np.float64))
+    edges[0]  = day0
+    edges[-1] = day0 + Ndays
+    return edges
+
+
+#====================================================================================================
+# Group dates into bins that blend equal-width and equal-count bins (see quantileedges())
+def groupquantile(date, date0, datef, Nbins, alpha=1.0, days=None):
+    '''
+    Inputs:
+    -------
+    date  - List of ordered dates in "yyyy/mm/dd" string format (not used if days is given)
+    date0 - Starting date in format of a datetime.datetime() object
+    datef - Ending date in format of a datetime.datetime() object (the bins span [date0, datef) like groupNdays())
+    Nbins - Number of bins
+    alpha - Blend of equal-width (0) and equal-count (1) bins
+    days  - Day numbers of the dates [days since 1970/01/01] (None to parse them from date)
+
+    Outputs:
+    --------
+    datebins, ibins - Date bins (edges, datetime.datetime() objects, not evenly spaced in time),
+                      Indices of input date array within each bin (a csrbins object, like groupNdays())
+    '''
+    # Parse all of the dates into day numbers at once
+    if (days is None): days = parsedates(date=date)[0]
+
+    # Bin edges, then the supernovae belonging to each bin
+    edges = quantileedges(days=days, day0=datetime2days(date0), Ndays=(datef - date0).days, Nbins=Nbins, alpha=alpha)
+    offsets, indices = assignbins(days=days, edges=edges)
+    usteps   = np.round((edges - edges[0]) * 86400.0e6).astype(np.int64)
+    datebins = [date0 + datetime.timedelta(microseconds=int(ustep)) for ustep in usteps]
+    return datebins, csrbins(offsets=offsets, indices=indices, edges=edges)
+
+
+#====================================================================================================
+# Calendar bin edges (month, quarter, year, or ISO week) covering a range of days
+def calendaredges(day0, dayf, unit='month', step=1, dayofmonth=1):
+    '''
+    Inputs:
+    -------
+    day0, dayf - First and last day to cover, inclusive [days since 1970/01/01]
+    unit       - Calendar unit of the bins ('month', 'quarter', 'year', or 'week' for ISO weeks starting on Monday)
+    step       - Number of units in each bin (e.g., step=2 with unit='month' for two-month bins)
+    dayofmonth - Day of the month that the month/quarter/year bins start on (clipped to the length of the month)
+
+    Outputs:
+    --------
+    edges - Bin edges [days since 1970/01/01] (int64), bin i is [edges[i], edges[i+1]),
+            the first edge is the start of the unit containing day0 and the last edge is after dayf
+    '''
+    day0 = int(np.floor(day0))
+    dayf = int(np.floor(dayf))
+    step = int(step)
+    if (step < 1): raise ValueError("The number of units in each bin must be at least 1")
+
+    # ISO weeks start on Monday (1970/01/01 was a Thursday)
+    if (unit == 'week'):
+        first = day0 - (day0 + 3) % 7
+        Nbins = (dayf - first) // (7 * step) + 1
+        return first + np.arange(Nbins + 1, dtype=np.int64) * 7 * step
+
+    # Months, quarters, and years are all whole numbers of months (counted from 1970/01)
+    if (unit not in ['month', 'quarter', 'year']):
+        raise ValueError("Unknown calendar unit '" + str(unit) + "', choose from ['month', 'quarter', 'year', 'week']")
+    Nmonths = {'month': 1, 'quarter': 3, 'year': 12}[unit] * step
+    month0  = np.datetime64(day0, 'D').astype('datetime64[M]').astype(np.int64)
+    monthf  = np.datetime64(dayf, 'D').astype('datetime64[M]').astype(np.int64)
+    if (unit != 'month'): month0 = month0 - month0 % {'quarter': 3, 'year': 12}[unit]  # Align to the quarter/year
+
+    # Start of the months (shifted to dayofmonth), then drop the edges that are not needed at either end
+    months = np.arange(month0 - Nmonths, monthf + 2 * Nmonths, Nmonths).astype('datetime64[M]')
+    starts = months.astype('datetime64[D]').astype(np.int64)
+    length = (months + 1).astype('datetime64[D]').astype(np.int64) - starts
+    edges  = starts + np.minimum(int(dayofmonth), length) - 1
+    i0 = np.searchsorted(edges, day0, side='right') - 1
+    i1 = np.searchsorted(edges, dayf, side='right')
+    return edges[i0:i1+1]
+
+
+#====================================================================================================
+# Group dates by calendar units (month, quarter, year, or ISO week)
+def groupcalendar(date, date0, datef, unit='month', step=1, dayofmonth=1, days=None):
+    '''
+    Inputs:
+    -------
+    date       - List of ordered dates in "yyyy/mm/dd" string format (not used if days is given)
+    date0      - Starting date in format of a datetime.datetime() object
+    datef      - Ending date in format of a datetime.datetime() object (the last bin contains it)
+    unit       - Calendar unit of the bins ('month', 'quarter', 'year', or 'week')
+    step       - Number of units in each bin
+    dayofmonth - Day of the month that the month/quarter/year bins start on
+    days       - Day numbers of the dates [days since 1970/01/01] (None to parse them from date)
+
+    Outputs:
+    --------
+    datebins, ibins - Date bins (edges, datetime.datetime() objects), Indices of input date array within each bin
+                      (a csrbins object, like groupNdays())
+    '''
+    # Parse all of the dates into day numbers at once
+    if (days is None): days = parsedates(date=date)[0]
+
+    # Bin edges, then the supernovae belonging to each bin
+    edges = calendaredges(day0=datetime2days(date0), dayf=datetime2days(datef), unit=unit, step=step, dayofmonth=dayofmonth)
+    offsets, indices = assignbins(days=days, edges=edges)
+    datebins = [datetime.datetime(1970, 1, 1) + datetime.timedelta(days=int(edge)) for edge in edges]
+    return datebins, csrbins(offsets=offsets, indices=indices, edges=edges)
 
 
 #====================================================================================================
@@ -94,82 +356,33 @@ def groupmonth(date, y0, m0, d0):
 
     Notes:
     ------
-    Something not right! len(datebins) should be 1 greater than len(imonths)
-    Just reqrite this routine to work the same way as groupNdays...
-    '''
-    # Initializations
-    Ndates = len(date)
-    y0   = int(y0)
-    m0   = int(m0)
-    yold = y0
-    mold = m0
-    datebins = []  # Output date bins
-    imonths  = []  # Output date indices belonging to each bin
-    j = 0
-
-    # Determine the number of bins
-    date0 = datetime.date(year=y0, month=m0, day=1)
-    ymdf  = date[-1].split('/')  # "yyyy/mm/dd"
-    datef = datetime.date(year=int(ymdf[0]), month=int(ymdf[1]), day=int(ymdf[2]))
-    Nbins = ((datef.year-1) - (date0.year+1))*12 + (12-m0+1) + (int(ymdf[1])+1)
-    #year  = y0
-    #month = m0
-    yold = y0
-    mold = m0
-    dold = d0
-    
-    # Initial date in the dataset
-    ymdnow  = date[0].split('/')  # "yyyy/mm/dd"
-    ynow    = int(ymdnow[0])
-    mnow    = int(ymdnow[1])
-    dnow    = int(ymdnow[2])
-    datenow = datetime.date(year=ynow, month=mnow, day=dnow)
-
-    # Loop through each date bin, collect the relevant supernovae
-    for i in np.arange(Nbins):
-
-        # Bounding dates for the current bin
-        datemin = datetime.date(year=yold, month=mold, day=dold)
-        year  = yold
-        month = mold + 1
-        if (month > 12):
-            month = 1
-            year  = yold + 1
-        datemax = datetime.date(year=year, month=month, day=dold)
-        
-        # Append datemin to the bins list
-        datebins.append(datemin)
-
-        # Initialize the list for this date bin
-        thisbin = []
-
-        # Collect the supernovae belonging to the current date bin
-        while ((datenow >= datemin) and (datenow < datemax) and (j < Ndates)):
-            
-            # Add the SN to this date bin
-            thisbin.append(j)
-            
-            # Move on to the next supernova
-            j = j + 1
-            if (j < Ndates):
-                ymdnow  = date[j].split('/')  # "yyyy/mm/dd"
-                ynow    = int(ymdnow[0])
-                mnow    = int(ymdnow[1])
-                dnow    = int(ymdnow[2])
-                datenow = datetime.date(year=ynow, month=mnow, day=dnow)
-    
-        # Add thisbin to the master list
-        imonths.append(thisbin)
-
-        # Update yol, mold, dold so that datemax will become the new datemin
-        yold = int(datemax.year)
-        mold = int(datemax.month)
-        dold = int(datemax.day)
-    
-    # Append the final datemax to the bins list
-    datebins.append(datemax)
-    
-    # We now have the supernova in a list of lists grouped by months
-    # ...e.g., imonths = [[0,1,2,3],[4,5],[6,7,8,9]]...
-    return datebins, imonths
+    Monthly bins from y0/m0/d0 through the month containing the last date (see groupcalendar()),
+    so len(datebins) is 1 greater than len(imonths).
+    '''
+    days  = parsedates(date=date)[0]
+    date0 = datetime.datetime(year=int(y0), month=int(m0), day=int(d0))
+    datef = datetime.datetime(1970, 1, 1) + datetime.timedelta(days=int(np.max(days)))
+    return groupcalendar(date=date, date0=date0, datef=datef, unit='month', dayofmonth=int(d0), days=days)
 
+if __name__ == "__main__":
+    # Time the binning of a few million sorted supernovae into tens of thousands of bins
+    Nsn   = 5000000
+    days  = np.sort(np.random.randint(-25000, 17500, Nsn)).astype(np.int64)
+    date0 = datetime.datetime(1901, 1, 1)
+    datef = datetime.datetime(2017, 12, 31)
+    for Nbins in [1000, 10000, 50000]:
+        t0 = time.time()
+        datebins, iNdays = groupNdays(date=None, date0=date0, datef=datef, Ndays=(datef - date0).days / float(Nbins), days=days)
+        t1 = time.time()
+        assignbins(days=days[::-1], edges=iNdays.edges)
+        t2 = time.time()
+        print("%d supernovae into %d bins: %.1f ms (sorted), %.1f ms (unsorted)" % (Nsn, len(iNdays), (t1 - t0) * 1e3, (t2 - t1) * 1e3))
+    for unit in ['week', 'month', 'quarter', 'year']:
+        t0 = time.time()
+        datebins, ibins = groupcalendar(date=None, date0=date0, datef=datef, unit=unit, days=days)
+        print("%d supernovae into %d %s bins: %.1f ms" % (Nsn, len(ibins), unit, (time.time() - t0) * 1e3))
+    for alpha in [0.0, 0.5, 1.0]:
+        t0 = time.time()
+        datebins, ibins = groupquantile(date=None, date0=date0, datef=datef, Nbins=10000, alpha=alpha, days=days)
+        counts = ibins.counts()
+        print("%d supernovae into %d bins (alpha = %.1f): %.1f ms, %d to %d per bin" % (Nsn, len(ibins), alpha, (time.time() - t0) * 1e3, np.min(counts), np.max(counts)))
@@ -0,0 +1,47 @@
+import os
+import glob
+
+'''
+Procedure:
+----------
+Keep a directory of cached files within a size budget by evicting the least recently used files first.
+
+Output:
+-------
+None (files are removed from the cache directory).
+
+Notes:
+------
+Shared by the on-disk caches (the Milky Way raster pyramid in mwraster.py and the supernovae setup sessions
+in sncache.py). A file counts as used when it is written or read, so readers should touch it with
+os.utime(fname, None) whenever they load it from the cache.
+'''
+
+#====================================================================================================
+# Evict the least recently used files matching the patterns until they fit within the size budget
+def evictlru(cachedir, patterns, budget, keep=[]):
+    '''
+    Inputs:
+    -------
+    cachedir - Directory for the cached files
+    patterns - List of glob patterns (relative to cachedir) for the files that count against the budget
+    budget   - Size budget for the cached files [bytes]
+    keep     - List of filenames that should not be evicted
+
+    Outputs:
+    --------
+    evicted - List of the evicted filenames
+    '''
+    fcached = []
+    for pattern in patterns: fcached = fcached + glob.glob(os.path.join(cachedir, pattern))
+    fcached.sort(key=os.path.getmtime)  # Oldest (least recently used) first
+    total   = sum([os.path.getsize(fname) for fname in fcached])
+    fkeeps  = [os.path.abspath(fkeep) for fkeep in keep]
+    evicted = []
+    for fname in fcached:
+        if (total <= budget): break
+        if (os.path.abspath(fname) in fkeeps): continue
+        total = total - os.path.getsize(fname)
+        os.remove(fname)
+        evicted.append(fname)
+    return evicted
@@ -1,6 +1,6 @@
 import numpy as np
-import h5py
 from PIL import Image
+from mwdata import writemwdata
 
 '''
 Procedure:
@@ -10,7 +10,7 @@ For the Milky Way panorama, retreive the RGB values of the pixels interior to th
 Output:
 -------
 HDF5 file containing the information needed to plot the Milky Way panorama on a Hammer projection
-(Grids of longitudes, latitudes, RGB values, along with a color tuple)
+(uint8 RGB values, mask of the ellipse, and grids of longitudes/latitudes, see mwdata.py)
 
 Resources:
 ----------
@@ -18,7 +18,9 @@ Milky Way Hammer-Aitoff projection --> http://www.milkywaysky.com/licenses.html
 
 Notes:
 ------
-I can't figure out how to plot RBG colors on a Hammer projection plot (went with grayscale instead)
+The projection and color lookup are done on whole blocks of image columns at a time (no per-pixel Python loop).
+Plotting RGB colors with pcolormesh on a Hammer projection plot is not possible (it used to be grayscale),
+so the full-color background is reprojected onto the figure pixels instead (see mwreproject.py)
 https://stackoverflow.com/questions/22222733/how-to-plot-an-irregular-spaced-rgb-image-using-python-and-basemap
 https://stackoverflow.com/questions/29232439/plotting-an-irregularly-spaced-rgb-image-in-python/29232957
 '''
@@ -29,9 +31,12 @@ fjpg = "/Users/salvesen/outreach/asom/supernovae/data/mwpan2_Aitoff_2000x1000.jp
 # Output HDF5 filename
 fout = "/Users/salvesen/outreach/asom/supernovae/data/milkyway.h5"
 
+# Number of image columns to process at a time (bounds the memory used by the temporary arrays)
+Nchunk = 512
+
 # Read in the JPG file (will get RGB values from this)
 im = Image.open(fjpg)
-rgb_im = im.convert('RGB')
+rgb_im = np.asarray(im.convert('RGB'))  # Shape is [Ny, Nx, 3]
 
 # Hammer projection --- see Wikipedia page for equations: https://en.wikipedia.org/wiki/Hammer_projection
 xmin = -2.0 * np.sqrt(2.0)  # Min x-value
@@ -42,35 +47,28 @@ Nx = im.size[0]
 Ny = im.size[1]
 x  = np.linspace(xmin, xmax, Nx)
 y  = np.linspace(ymin, ymax, Ny)
-lon_grid = np.zeros([Nx, Ny])  # [lonmin, lonmax] = [-180, +180] degrees
-lat_grid = np.zeros([Nx, Ny])  # [latmin, latmax] = [-90, + 90] degrees
-rgb_grid = np.zeros([Nx, Ny, 3])
+lon_grid = np.zeros([Nx, Ny], dtype=np.float32) + np.nan  # [lonmin, lonmax] = [-180, +180] degrees
+lat_grid = np.zeros([Nx, Ny], dtype=np.float32) + np.nan  # [latmin, latmax] = [-90, + 90] degrees
+rgb_grid = np.zeros([Nx, Ny, 3], dtype=np.uint8)
+in_grid  = np.zeros([Nx, Ny], dtype=bool)
+
+# Work through the pixels in the JPG image a block of columns at a time
+# ...Values are left as NaN outside the ellipse
+for i0 in np.arange(0, Nx, Nchunk):
+    i1 = min(i0 + Nchunk, Nx)
+    xx, yy = np.meshgrid(x[i0:i1], y, indexing='ij')  # Shape is [i1-i0, Ny]
 
-# Loop through the pixel in the JPG image
-for i in np.arange(Nx):
-    for j in np.arange(Ny):
-    
-        # Check that we are inside the ellipse, get the longitude/latitude
-        if ((0.125*x[i]**2 + 0.5*y[j]**2) < 1.0):
-            z = np.sqrt(1.0 - (0.25 * x[i])**2 - (0.5 * y[j])**2)
-            lon_grid[i,j] = 2.0 * np.arctan(z * x[i] / (2.0 * (2.0 * z**2 - 1.0)))
-            lat_grid[i,j] = np.arcsin(z * y[j])
-            r, g, b = rgb_im.getpixel((i,j))
-            rgb_grid[i,j,:] = [r/255.0, g/255.0, b/255.0]
-        
-        # Set values to NaN if outside the ellipse
-        else:
-            lon_grid[i,j]   = np.nan
-            lat_grid[i,j]   = np.nan
-            rgb_grid[i,j,:] = np.nan
+    # Check that we are inside the ellipse, get the longitude/latitude
+    inside = (0.125*xx**2 + 0.5*yy**2) < 1.0
+    in_grid[i0:i1] = inside
+    xin = xx[inside]
+    yin = yy[inside]
+    z   = np.sqrt(1.0 - (0.25 * xin)**2 - (0.5 * yin)**2)
+    lon_grid[i0:i1][inside] = 2.0 * np.arctan(z * xin / (2.0 * (2.0 * z**2 - 1.0)))
+    lat_grid[i0:i1][inside] = np.arcsin(z * yin)
 
-# Flatten the RGB grid for plotting with pcolormesh
-colorTuple = tuple(np.array([rgb_grid[:,:,0].flatten(), rgb_grid[:,:,1].flatten(), rgb_grid[:,:,2].flatten()]).transpose().tolist())
+    # Pixel (i,j) of the image is column i, row j
+    rgb_grid[i0:i1][inside] = rgb_im[:, i0:i1, :].transpose(1, 0, 2)[inside]
 
-# Output colorTuple to an HDF5 file
-f = h5py.File(fout, 'w')
-f.create_dataset('lon_grid',   data=lon_grid)
-f.create_dataset('lat_grid',   data=lat_grid)
-f.create_dataset('rgb_grid',   data=rgb_grid)
-f.create_dataset('colorTuple', data=colorTuple)
-f.close()
+# Output the compact (uint8/bool/float32, compressed) Milky Way data to an HDF5 file
+writemwdata(fout=fout, rgb=rgb_grid, inside=in_grid, lon=lon_grid, lat=lat_grid)
@@ -0,0 +1,114 @@
+import numpy as np
+import h5py
+
+'''
+Procedure:
+----------
+Read/write the Milky Way panorama data for the Hammer projection (milkyway.h5).
+
+Schema (version 2):
+-------------------
+All datasets are on the [Nx, Ny] grid of image columns/rows, chunked and gzip-compressed.
+    'rgb'    - uint8 [Nx, Ny, 3] RGB values of the panorama pixels (0 outside the ellipse)
+    'inside' - bool  [Nx, Ny] mask of the pixels inside the Hammer projection ellipse
+    'lon'    - float32 [Nx, Ny] Galactic longitude [radians] (NaN outside the ellipse)
+    'lat'    - float32 [Nx, Ny] Galactic latitude [radians] (NaN outside the ellipse)
+The root attribute 'version' holds the schema version.
+Files written with the old schema ('lon_grid', 'lat_grid', 'rgb_grid', 'colorTuple') can still be read.
+
+Notes:
+------
+The old file stored the colors three times over in float64 (including a tuple of lists for every pixel).
+The mwdata class only reads a dataset the first time something needs it, and only builds the float grids
+that the renderer asks for (e.g., pcolormesh needs the lon/lat grids and one color channel, all float32).
+'''
+
+# Schema version written to the root attributes of the Milky Way data file
+mwversion = 2
+
+# Compression for all of the datasets
+h5opts = {'compression': 'gzip', 'compression_opts': 4, 'shuffle': True}
+
+#====================================================================================================
+# Write out the Milky Way data
+def writemwdata(fout, rgb, inside, lon, lat):
+    '''
+    Inputs:
+    -------
+    fout     - Filename for the Milky Way data
+    rgb      - uint8 [Nx, Ny, 3] RGB values of the panorama pixels
+    inside   - bool [Nx, Ny] mask of the pixels inside the Hammer projection ellipse
+    lon, lat - [Nx, Ny] Galactic longitude/latitude grids [radians] (NaN outside the ellipse)
+    '''
+    Nx, Ny = inside.shape
+    chunks = (min(Nx, 256), min(Ny, 256))
+    f = h5py.File(fout, 'w')
+    f.attrs['version'] = mwversion
+    f.create_dataset('rgb',    data=np.asarray(rgb, dtype=np.uint8) * inside[:,:,None], chunks=chunks + (3,), **h5opts)
+    f.create_dataset('inside', data=np.asarray(inside, dtype=bool), chunks=chunks, **h5opts)
+    f.create_dataset('lon',    data=np.asarray(lon, dtype=np.float32), chunks=chunks, **h5opts)
+    f.create_dataset('lat',    data=np.asarray(lat, dtype=np.float32), chunks=chunks, **h5opts)
+    f.close()
+
+
+#====================================================================================================
+class mwdata(object):
+    '''
+    Lazily loaded Milky Way data (each dataset is read, and each grid built, only on first use)
+
+    Inputs:
+    -------
+    fmway - Filename for the Milky Way data (output of milkyway.py)
+    '''
+    def __init__(self, fmway):
+        self.fmway = fmway
+        self.cache = {}
+        f = h5py.File(fmway, 'r')
+        self.version = int(f.attrs.get('version', 1))
+        f.close()
+
+    # Read a dataset (once)
+    def read(self, key):
+        if (key not in self.cache):
+            f = h5py.File(self.fmway, 'r')
+            self.cache[key] = f[key][()]
+            f.close()
+        return self.cache[key]
+
+    # Mask of the pixels inside the Hammer projection ellipse [Nx, Ny]
+    @property
+    def inside(self):
+        if (self.version < 2): return ~np.isnan(self.read('lon_grid'))
+        return self.read('inside')
+
+    # uint8 RGB values [Nx, Ny, 3]
+    @property
+    def rgb(self):
+        if (self.version < 2):
+            if ('rgb' not in self.cache): self.cache['rgb'] = np.round(np.nan_to_num(self.read('rgb_grid')) * 255.0).astype(np.uint8)
+            return self.cache['rgb']
+        return self.read('rgb')
+
+    # Galactic longitude/latitude grids [radians] for plotting (NaN outside the ellipse)
+    @property
+    def lon_grid(self):
+        if (self.version < 2): return self.read('lon_grid')
+        return self.read('lon')
+
+    @property
+    def lat_grid(self):
+        if (self.version < 2): return self.read('lat_grid')
+        return self.read('lat')
+
+    # One color channel (0, 1, 2 for R, G, B) scaled to [0, 1] (float32, NaN outside the ellipse)
+    def channel(self, i):
+        channel = self.rgb[:,:,i].astype(np.float32) / np.float32(255.0)
+        channel[~self.inside] = np.nan
+        return channel
+
+    # Flattened [Nx*Ny, 3] colors scaled to [0, 1] (NaN outside the ellipse), what colorTuple used to hold
+    @property
+    def colors(self):
+        colors = self.rgb.reshape(-1, 3) / 255.0
+        colors[~self.inside.ravel()] = np.nan
+        return colors
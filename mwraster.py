@@ -0,0 +1,212 @@
+import os
+import hashlib
+import numpy as np
+from PIL import Image
+from mwdata import mwdata
+from mwreproject import loadlut, reproject
+from lrucache import evictlru
+
+'''
+Procedure:
+----------
+Render the Milky Way panorama (in full color) on the Hammer projection once and cache the result on disk as a pyramid of
+raster images, one for each of the standard (YouTube) resolutions from 240p to 4320p.
+
+Output:
+-------
+uint8 [Nypix, Nxpix, 3] RGB image of the whole figure background (black, with the projected panorama inside
+the axes), cached as .npy files in a directory next to the Milky Way data file.
+
+Notes:
+------
+Drawing the panorama with pcolormesh over the full lon/lat grid is slow (and grayscale only), and plots() used
+to pay for it every time the figure was built. The panorama is now reprojected onto the figure pixels with a
+lookup table (see mwreproject.py), which keeps the RGB colors, and the lookup tables are cached in the same
+directory as the rasters. The raster only depends on the Milky Way data file, the figure size in pixels,
+the axes position, and the projection (nothing in it scales with the dpi), so it is keyed on those
+(the data file by its name, size, and modification time). plots() composites the raster under each frame
+with fig.figimage(), which puts it on the figure pixel for pixel because the frames are saved at the same
+dpi as the figure.
+
+Pyramid:
+--------
+A request for any resolution is served from the nearest pyramid level at or above it (resized when the
+resolution is not one of the levels). A missing level is downsampled from the nearest larger level that is
+already cached, and only rendered from scratch when there is none, so previews and production renders do
+not each reproject the panorama. buildpyramid() renders the top level once and derives all of the others.
+The cached levels and lookup tables are evicted, least recently used first, whenever they add up to more than the size budget.
+'''
+
+# Resolutions [number of y-pixels] of the pyramid levels
+pyramidres = [240, 360, 480, 720, 1080, 1440, 2160, 4320]
+
+# Size budget for the cached levels [bytes]
+cachebudget = 512 * 1024**2
+
+#====================================================================================================
+# Default directory for the cached rasters (next to the Milky Way data file)
+def cachedirname(fmway):
+    return os.path.join(os.path.dirname(os.path.abspath(fmway)), 'mwcache')
+
+
+#====================================================================================================
+# Name shared by all of the pyramid levels of a particular figure setup
+def pyramidkey(fmway, aspect, axpos, projection='hammer'):
+    '''
+    Inputs:
+    -------
+    fmway      - Filename for the Milky Way data (output of milkyway.py)
+    aspect     - Aspect ratio of the figure (Nxpix / Nypix)
+    axpos      - Position of the axes in figure coordinates (left, bottom, width, height)
+    projection - Projection of the axes
+
+    Outputs:
+    --------
+    key - String naming the pyramid (e.g., 'hammer_0123456789ab'), the levels are key + '_1080p.npy', etc.
+    '''
+    stat  = os.stat(fmway)
+    token = "%s|%d|%d|%s|%.6f|%s" % (os.path.abspath(fmway), stat.st_size, int(stat.st_mtime), projection, aspect, ','.join(['%.6f' % pos for pos in axpos]))
+    return "%s_%s" % (projection, hashlib.md5(token.encode('utf-8')).hexdigest()[:12])
+
+
+#====================================================================================================
+# Figure size [pixels] of a pyramid level
+def levelsize(pixres, aspect):
+    return int(round(pixres * aspect)), int(pixres)
+
+
+#====================================================================================================
+# Render the Milky Way background for a figure setup
+def renderbackground(fmway, Nxpix, Nypix, axpos, projection='hammer', cachedir=None):
+    '''
+    Inputs:
+    -------
+    fmway        - Filename for the Milky Way data (output of milkyway.py)
+    Nxpix, Nypix - Size of the figure [pixels]
+    axpos        - Position of the axes in figure coordinates (left, bottom, width, height)
+    projection   - Projection of the axes
+    cachedir     - Directory for the cached lookup tables (None to not cache them)
+
+    Outputs:
+    --------
+    raster - uint8 [Nypix, Nxpix, 3] RGB image of the figure background
+    '''
+    mway = mwdata(fmway=fmway)
+    Nxsrc, Nysrc = mway.inside.shape
+    target, source = loadlut(cachedir=cachedir, Nxpix=Nxpix, Nypix=Nypix, axpos=axpos, Nxsrc=Nxsrc, Nysrc=Nysrc, projection=projection)
+
+    # Only keep the panorama pixels inside the ellipse (the rest are black anyway)
+    keep = mway.inside.ravel()[source]
+    return reproject(mway.rgb, target=target[keep], source=source[keep], Nxpix=Nxpix, Nypix=Nypix)
+
+
+#====================================================================================================
+# Resize a raster to a new size [pixels]
+def resizeraster(raster, Nxpix, Nypix):
+    if (raster.shape[:2] == (Nypix, Nxpix)): return raster
+    return np.asarray(Image.fromarray(raster).resize((Nxpix, Nypix), Image.LANCZOS))
+
+
+#====================================================================================================
+# Evict the least recently used pyramid levels (and lookup tables) until the cache fits within the size budget
+def evictlevels(cachedir, budget=cachebudget, keep=[]):
+    '''
+    Inputs:
+    -------
+    cachedir - Directory for the cached rasters
+    budget   - Size budget for the cached levels and lookup tables [bytes]
+    keep     - List of filenames that should not be evicted
+
+    Outputs:
+    --------
+    evicted - List of the evicted filenames
+    '''
+    return evictlru(cachedir=cachedir, patterns=['*p.npy', '*_lut.npz'], budget=budget, keep=keep)
+
+
+#====================================================================================================
+# Collect one pyramid level, downsampling it from a larger cached level or rendering it if needed
+def loadlevel(fmway, pixres, aspect, axpos, projection='hammer', cachedir=None, budget=cachebudget):
+    '''
+    Inputs:
+    -------
+    fmway      - Filename for the Milky Way data (output of milkyway.py)
+    pixres     - Resolution of the level [number of y-pixels] (one of pyramidres)
+    aspect     - Aspect ratio of the figure (Nxpix / Nypix)
+    axpos      - Position of the axes in figure coordinates (left, bottom, width, height)
+    projection - Projection of the axes
+    cachedir   - Directory for the cached rasters (default is 'mwcache' next to fmway)
+    budget     - Size budget for the cached levels [bytes]
+
+    Outputs:
+    --------
+    raster - uint8 [Nypix, Nxpix, 3] RGB image of the figure background
+    '''
+    if (cachedir == None): cachedir = cachedirname(fmway)
+    froot  = os.path.join(cachedir, pyramidkey(fmway=fmway, aspect=aspect, axpos=axpos, projection=projection))
+    flevel = froot + '_%dp.npy' % pixres
+    Nxpix, Nypix = levelsize(pixres=pixres, aspect=aspect)
+    if (os.path.exists(flevel)):
+        os.utime(flevel, None)  # Mark it as recently used
+        return np.load(flevel)
+
+    # Downsample the nearest larger level that is already cached, otherwise render the level from scratch
+    raster = None
+    for res in pyramidres:
+        if ((res > pixres) and os.path.exists(froot + '_%dp.npy' % res)):
+            raster = resizeraster(np.load(froot + '_%dp.npy' % res), Nxpix=Nxpix, Nypix=Nypix)
+            break
+    if (raster is None): raster = renderbackground(fmway=fmway, Nxpix=Nxpix, Nypix=Nypix, axpos=axpos, projection=projection, cachedir=cachedir)
+
+    if (not os.path.exists(cachedir)): os.makedirs(cachedir)
+    np.save(flevel, raster)
+    evictlevels(cachedir=cachedir, budget=budget, keep=[flevel])
+    return raster
+
+
+#====================================================================================================
+# Render the top pyramid level once and derive all of the lower levels from it
+def buildpyramid(fmway, aspect, axpos, projection='hammer', cachedir=None, budget=cachebudget, levels=pyramidres):
+    '''
+    Inputs:
+    -------
+    fmway      - Filename for the Milky Way data (output of milkyway.py)
+    aspect     - Aspect ratio of the figure (Nxpix / Nypix)
+    axpos      - Position of the axes in figure coordinates (left, bottom, width, height)
+    projection - Projection of the axes
+    cachedir   - Directory for the cached rasters (default is 'mwcache' next to fmway)
+    budget     - Size budget for the cached levels [bytes]
+    levels     - Resolutions of the levels to build
+    '''
+    for pixres in sorted(levels, reverse=True):
+        loadlevel(fmway=fmway, pixres=pixres, aspect=aspect, axpos=axpos, projection=projection, cachedir=cachedir, budget=budget)
+
+
+#====================================================================================================
+# Collect the Milky Way background for a figure setup from the nearest pyramid level
+def loadbackground(fmway, Nxpix, Nypix, axpos, projection='hammer', cachedir=None, budget=cachebudget):
+    '''
+    Inputs:
+    -------
+    fmway        - Filename for the Milky Way data (output of milkyway.py)
+    Nxpix, Nypix - Size of the figure [pixels]
+    axpos        - Position of the axes in figure coordinates (left, bottom, width, height)
+    projection   - Projection of the axes
+    cachedir     - Directory for the cached rasters (default is 'mwcache' next to fmway)
+    budget       - Size budget for the cached levels [bytes]
+
+    Outputs:
+    --------
+    raster - uint8 [Nypix, Nxpix, 3] RGB image of the figure background
+    '''
+    Nxpix, Nypix = int(round(Nxpix)), int(round(Nypix))
+    aspect = float(Nxpix) / Nypix
+
+    # Nearest level at or above the requested resolution (the top level for anything larger)
+    pixres = pyramidres[-1]
+    for res in pyramidres:
+        if (res >= Nypix):
+            pixres = res
+            break
+    raster = loadlevel(fmway=fmway, pixres=pixres, aspect=aspect, axpos=axpos, projection=projection, cachedir=cachedir, budget=budget)
+    return resizeraster(raster, Nxpix=Nxpix, Nypix=Nypix)
@@ -0,0 +1,181 @@
+import os
+import hashlib
+import numpy as np
+
+'''
+Procedure:
+----------
+Reproject the (Hammer-Aitoff) Milky Way panorama onto the pixels of a figure with a lookup table.
+
+Output:
+-------
+Full-color uint8 [Nypix, Nxpix, 3] RGB image of the figure background.
+
+Notes:
+------
+For every figure pixel inside the map axes, the lookup table holds the index of the panorama pixel that lands
+there: the pixel center is taken through the inverse of the axes projection to (lon, lat), and then through the
+forward Hammer projection of the panorama (see milkyway.py) to a panorama pixel (nearest neighbor).
+Rendering a background is then just one fancy-indexing gather per color channel, so the panorama keeps its
+RGB colors (pcolormesh could only do grayscale) and costs a fraction of drawing a quad mesh.
+The lookup table only depends on the figure size, axes position, axes projection, and the panorama size,
+so it is cached on disk and shared by every Milky Way data file with the same panorama size.
+
+Conventions (the same as plots()):
+    The projected ellipse fills a centered 2:1 box inside the axes position, like the matplotlib 'hammer' and
+    'mollweide' axes do
+    The panorama latitudes are plotted flipped (lat_grid*-1.0)
+'''
+
+# Projected half-widths/half-heights of the map axes (the same for the Hammer and Mollweide projections)
+xscale = 2.0 * np.sqrt(2.0)
+yscale = 1.0 * np.sqrt(2.0)
+
+# Projections that the map axes can have
+projections = ['hammer', 'mollweide']
+
+#====================================================================================================
+# Forward Hammer projection
+def hammer(lon, lat):
+    '''
+    Inputs:
+    -------
+    lon, lat - Arrays of longitude/latitude [radians]
+
+    Outputs:
+    --------
+    x, y - Projected coordinates (x in [-2*sqrt(2), 2*sqrt(2)], y in [-sqrt(2), sqrt(2)])
+    '''
+    denom = np.sqrt(np.maximum(1.0 + np.cos(lat) * np.cos(0.5 * lon), 1.0e-12))
+    x = 2.0 * np.sqrt(2.0) * np.cos(lat) * np.sin(0.5 * lon) / denom
+    y = np.sqrt(2.0) * np.sin(lat) / denom
+    return x, y
+
+
+#====================================================================================================
+# Inverse of the map projections
+def inverse(x, y, projection='hammer'):
+    '''
+    Inputs:
+    -------
+    x, y       - Arrays of projected coordinates
+    projection - Projection of the map axes ('hammer' or 'mollweide')
+
+    Outputs:
+    --------
+    lon, lat, valid - Arrays of longitude/latitude [radians], Boolean mask of the points on the map
+    '''
+    if (projection == 'hammer'):
+        valid = (0.125 * x**2 + 0.5 * y**2) <= 1.0
+        z   = np.sqrt(np.maximum(1.0 - (0.25 * x)**2 - (0.5 * y)**2, 0.0))
+        lon = 2.0 * np.arctan2(z * x, 2.0 * (2.0 * z**2 - 1.0))
+        lat = np.arcsin(np.clip(z * y, -1.0, 1.0))
+        return lon, lat, valid
+    if (projection == 'mollweide'):
+        theta = np.arcsin(np.clip(y / np.sqrt(2.0), -1.0, 1.0))
+        lon   = np.pi * x / (2.0 * np.sqrt(2.0) * np.maximum(np.cos(theta), 1.0e-12))
+        lat   = np.arcsin(np.clip((2.0 * theta + np.sin(2.0 * theta)) / np.pi, -1.0, 1.0))
+        valid = (np.abs(lon) <= np.pi) & (np.abs(y) <= np.sqrt(2.0))
+        return lon, lat, valid
+    raise ValueError("Unknown projection '" + str(projection) + "', choose from " + str(projections))
+
+
+#====================================================================================================
+# Build the lookup table from figure pixels to panorama pixels
+def buildlut(Nxpix, Nypix, axpos, Nxsrc, Nysrc, projection='hammer'):
+    '''
+    Inputs:
+    -------
+    Nxpix, Nypix - Size of the figure [pixels]
+    axpos        - Position of the map axes in figure coordinates (left, bottom, width, height)
+    Nxsrc, Nysrc - Size of the panorama [pixels] (the [Nx, Ny] grid of milkyway.h5)
+    projection   - Projection of the map axes ('hammer' or 'mollweide')
+
+    Outputs:
+    --------
+    target, source - Flat indices of the figure pixels (into [Nypix, Nxpix]) and of the panorama pixels
+                     (into [Nxsrc, Nysrc]) that land on them
+    '''
+    left, bottom, width, height = axpos
+    x0 = left * Nxpix                       # Left edge of the axes [pixels from the left]
+    y0 = (1.0 - bottom - height) * Nypix    # Top edge of the axes [pixels from the top]
+    w  = width * Nxpix
+    h  = height * Nypix
+
+    # The map is drawn in a centered 2:1 box that fits inside the axes position (like set_aspect(0.5, anchor='C'))
+    if (w > 2.0 * h):
+        x0 = x0 + 0.5 * (w - 2.0 * h)
+        w  = 2.0 * h
+    else:
+        y0 = y0 + 0.5 * (h - 0.5 * w)
+        h  = 0.5 * w
+
+    # Centers of the figure pixels covered by the axes, in projected coordinates
+    px = np.arange(max(int(np.floor(x0)), 0), min(int(np.ceil(x0 + w)), Nxpix))
+    py = np.arange(max(int(np.floor(y0)), 0), min(int(np.ceil(y0 + h)), Nypix))
+    x  = (2.0 * (px + 0.5 - x0) / w - 1.0) * xscale
+    y  = (1.0 - 2.0 * (py + 0.5 - y0) / h) * yscale
+    xx, yy = np.meshgrid(x, y)
+
+    # Figure pixel --> (lon, lat) on the map --> panorama pixel
+    lon, lat, valid = inverse(xx, yy, projection=projection)
+    xs, ys = hammer(lon, -lat)  # The panorama latitudes are plotted flipped
+    i = np.clip(np.round((xs + xscale) / (2.0 * xscale) * (Nxsrc - 1)), 0, Nxsrc - 1).astype(np.int64)
+    j = np.clip(np.round((ys + yscale) / (2.0 * yscale) * (Nysrc - 1)), 0, Nysrc - 1).astype(np.int64)
+
+    ipy, ipx = np.nonzero(valid)
+    target = (py[ipy] * Nxpix + px[ipx]).astype(np.uint32 if (Nxpix * Nypix < 2**32) else np.int64)
+    source = (i[valid] * Nysrc + j[valid]).astype(np.uint32 if (Nxsrc * Nysrc < 2**32) else np.int64)
+    return target, source
+
+
+#====================================================================================================
+# Filename of the cached lookup table for a figure setup
+def lutname(cachedir, Nxpix, Nypix, axpos, Nxsrc, Nysrc, projection='hammer'):
+    token = "%d|%d|%s|%d|%d|%s" % (Nxpix, Nypix, ','.join(['%.6f' % pos for pos in axpos]), Nxsrc, Nysrc, projection)
+    return os.path.join(cachedir, "%s_%dx%d_%s_lut.npz" % (projection, Nxpix, Nypix, hashlib.md5(token.encode('utf-8')).hexdigest()[:12]))
+
+
+#====================================================================================================
+# Collect the lookup table for a figure setup, building and caching it if needed
+def loadlut(cachedir, Nxpix, Nypix, axpos, Nxsrc, Nysrc, projection='hammer'):
+    '''
+    Inputs:
+    -------
+    cachedir     - Directory for the cached lookup tables (None to not cache them)
+    (See buildlut() for the rest)
+
+    Outputs:
+    --------
+    target, source - See buildlut()
+    '''
+    if (cachedir == None): return buildlut(Nxpix=Nxpix, Nypix=Nypix, axpos=axpos, Nxsrc=Nxsrc, Nysrc=Nysrc, projection=projection)
+    flut = lutname(cachedir=cachedir, Nxpix=Nxpix, Nypix=Nypix, axpos=axpos, Nxsrc=Nxsrc, Nysrc=Nysrc, projection=projection)
+    if (os.path.exists(flut)):
+        os.utime(flut, None)  # Mark it as recently used
+        with np.load(flut) as lut: return lut['target'], lut['source']
+    target, source = buildlut(Nxpix=Nxpix, Nypix=Nypix, axpos=axpos, Nxsrc=Nxsrc, Nysrc=Nysrc, projection=projection)
+    if (not os.path.exists(cachedir)): os.makedirs(cachedir)
+    np.savez(flut, target=target, source=source)
+    return target, source
+
+
+#====================================================================================================
+# Reproject the panorama onto a figure with the lookup table
+def reproject(rgb, target, source, Nxpix, Nypix, background=0):
+    '''
+    Inputs:
+    -------
+    rgb            - uint8 [Nxsrc, Nysrc, 3] RGB values of the panorama pixels (mwdata.rgb)
+    target, source - Lookup table (output of buildlut()/loadlut())
+    Nxpix, Nypix   - Size of the figure [pixels]
+    background     - Value of the figure pixels off of the map (0 is black)
+
+    Outputs:
+    --------
+    raster - uint8 [Nypix, Nxpix, 3] RGB image of the figure background
+    '''
+    raster = np.zeros([Nypix, Nxpix, 3], dtype=np.uint8) + np.uint8(background)
+    for c in np.arange(3):
+        raster[:,:,c].flat[target] = rgb[:,:,c].ravel()[source]
+    return raster
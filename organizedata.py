@@ -1,9 +1,13 @@
+import os
 import numpy as np
-import h5py
-import astropy.units as u
-import astropy.coordinates as coord
-from astropy.io import ascii
-from datetime import datetime
+from readcatalog import readcatalog
+from readjson import readjsondir
+from reducefields import reducecatalog
+from parsedates import parsedates, days2ymd
+from skycoords import radec2galactic
+from sndata import rowhashes, rowkeys, sortorder, readkeys, readsndata, writesndata, mergesndata, readscreen, writescreen, screencols
+from filterbursts import screen, screenreasons, writereport
+from snarrow import writearrow
 
 '''
 Procedure:
@@ -15,6 +19,15 @@ Require Date >= the year 1900.
 Output:
 -------
 An HDF5 file of the filtered and organized supernovae data.
+Optionally, the same data as an Arrow IPC or Parquet file with one row group per year (requires pyarrow, see snarrow.py).
+
+Incremental Mode:
+-----------------
+Off by default (every run rebuilds the output file from the catalog).
+With incremental = True and an existing output file, only the catalog rows that are new or have changed
+(keyed on the supernova 'Name' and a fingerprint of the raw row) are processed and merged into the output file.
+The burst/duplicate screening still covers the whole catalog: the rows screened before come from the screening
+ledger of the output file (see sndata.writescreen()), so the result is the same as a full rebuild.
 
 Resources:
 ----------
@@ -22,67 +35,145 @@ Supernovae Data --> https://sne.space/ (Guillochon et al. 2017, ApJ, 835, 64)
 
 Notes:
 ------
-Some bad data still need to be filtered out, like 200+ discovered in one day in the Galactic plane?!
-The data entry with index i=31996 has a formatting issue, so I fix it in place.
+Bad data like 200+ discovered in one day in the Galactic plane?! and duplicate entries are found by filterbursts.py.
+Entries with malformed dates (e.g., the old i=31996 and i=37187 formatting issues) are masked out by parsedates().
 '''
 # Output HDF5 filename
 fh5 = "/Users/salvesen/outreach/asom/supernovae/data/SNedata.h5"
 
+# Also export the organized data to a columnar file ('.arrow'/'.feather' for Arrow IPC, '.parquet' for Parquet)
+# ...set to None to only write the HDF5 file
+farrow = None
+
 # Do not include any supernova from 2018 onward
 endyear = 2018
 
-# Collect the raw supernovae data
+# Remove the implausible bursts of discoveries and the exact duplicates (otherwise they are only reported)
+rejectbursts = False
+freport = "/Users/salvesen/outreach/asom/supernovae/data/SNerejected.txt"
+
+# Only process new/changed supernovae and merge them into an existing output file
+incremental = False
+
+# How to reduce the fields with multiple (comma-separated) entries to a single value
+# ...'first' for all fields, or 'mean', 'median', 'min' for mmax, z, RA/DEC (see reducefields.py)...
+fieldreducers = {'mmax': 'first', 'z': 'first', 'R.A.': 'first', 'Dec.': 'first'}
+
+# Collect the raw supernovae data (as strings, missing values are filled in with 'nan')
 # RA  : [ 00h:00m:00.0s,  24h:00m:00.0s]
 # DEC : [-90d:00m:00.0s, +90d:00m:00.0s]
-fcsv  = "/Users/salvesen/outreach/asom/supernovae/data/The_Open_Supernova_Catalog.csv"
-table = ascii.read(fcsv, header_start=0, data_start=1)
+# ...or read the same fields from a directory of per-object OSC JSON files (parsed in parallel, see readjson.py)
+fcsv    = "/Users/salvesen/outreach/asom/supernovae/data/The_Open_Supernova_Catalog.csv"
+jsondir = None
+if (jsondir != None): table = readjsondir(jsondir=jsondir)
+else: table = readcatalog(fcsv=fcsv, dtypes={})
+
+# Fingerprint each row of the catalog so that we can tell which supernovae are new or have changed
+rowhash = rowhashes(table=table)
+catname = np.char.partition(table['Name'], ',')[:,0]
+keys    = rowkeys(name=catname, rowhash=rowhash)
+
+# Incremental mode: compare against the catalog rows already screened into the output file (its screening ledger)
+# ...The rows rejected as bursts/duplicates, or by the filters below, are in the ledger too, so they are not processed again
+# ...except for the rejected ones when rejectbursts is set (the screening might not reject them anymore, then they are added)
+# ...Output files without a ledger, or screened with different settings, are rebuilt from scratch
+settings = {'rejectbursts': rejectbursts, 'endyear': endyear}
+merge    = False
+iproc    = np.arange(len(keys))  # Catalog rows to process
+if (incremental and os.path.exists(fh5)):
+    ledger, oldsettings = readscreen(fh5=fh5)
+    if ((ledger != None) and (oldsettings == settings)):
+        merge      = True
+        oldname, oldhash = readkeys(fh5=fh5)
+        oldkeys    = rowkeys(name=oldname, rowhash=oldhash)
+        dropnames  = oldname[~np.isin(oldkeys, keys)]  # Changed or no longer in the catalog
+        ledgerkeys = rowkeys(name=ledger['name'], rowhash=ledger['rowhash'])
+        inledger   = np.isin(ledgerkeys, keys)
+        inew       = np.where(~np.isin(keys, ledgerkeys))[0]
+        print "Incremental update: ", len(inew), " new/changed catalog rows, ", len(dropnames), " supernovae to remove"
+        if ((len(inew) == 0) and np.all(inledger)):
+            if (farrow != None): writearrow(fout=farrow, data=readsndata(fh5=fh5))
+            quit()
+
+        # Where the ledger rows are in the catalog now, and which of them are processed again
+        isort = np.argsort(keys)
+        icat  = isort[np.searchsorted(keys[isort], ledgerkeys[inledger])]
+        redo  = rejectbursts & (ledger['reason'][inledger] != screenreasons.index('kept'))
+        iproc = np.union1d(inew, icat[redo])
+
+        # The rest of the ledger rows are only screened again (or just carried over, if they did not pass the filters)
+        ledgerkept = {'icat': icat[~redo]}
+        for key in screencols:
+            ledgerkept[key] = ledger[key][inledger][~redo]
+
+        for col in table.keys():
+            table[col] = table[col][iproc]
+        rowhash = rowhash[iproc]
+        catname = catname[iproc]
+
+# Reduce the multi-valued fields to a single value for each supernova (whole columns at a time)
+table = reducecatalog(table=table, fieldreducers=fieldreducers)
 name  = table['Name']
 date  = table['Disc. Date']  # 'yyyy/mm/dd'
 mmax  = table['mmax']  # Maximum apparent AB magnitude
 host  = table['Host Name']
-ra    = table['R.A.']  # [hour:arcmin:arcsec]
-dec   = table['Dec.']  # [degree:arcmin:arcsec]
+ra    = table['R.A.']  # [degrees]
+dec   = table['Dec.']  # [degrees]
 z     = table['z']     # Redshift
 type  = table['Type']  # Classification (e.g., Ia, II)
 
-# Fill in missing values with NaN's
-name = name.filled(np.nan)
-date = date.filled(np.nan)
-mmax = mmax.filled(np.nan)
-host = host.filled(np.nan)
-ra   = ra.filled(np.nan)
-dec  = dec.filled(np.nan)
-z    = z.filled(np.nan)
-type = type.filled(np.nan)
-
-# Function to convert 'yyyy/mm/dd' string to yyyy.yy float
-def fractionalyear(yyyymmdd):
-    yyyymmdd = yyyymmdd.split('/')
-    yyyy     = yyyymmdd[0].zfill(4)
-    mm       = yyyymmdd[1]
-    dd       = yyyymmdd[2]
-    dateobj  = datetime.strptime(yyyy+'/'+mm+'/'+dd, '%Y/%m/%d')
-    year_part   = dateobj - datetime(year=dateobj.year, month=1, day=1)
-    year_length = datetime(year=dateobj.year+1, month=1, day=1) - datetime(year=dateobj.year, month=1, day=1)
-    year_frac   = dateobj.year + (float(year_part.days) / float(year_length.days))
-    return year_frac
-
-# Loop through the supernovae and discard those without date information and/or RA/DEC information
-Nlines = len(date)
-igood  = []
-for i in np.arange(Nlines):
-    # We require adequate RA/DEC and date information
-    thisdate = date[i].split(',')[0]
-    datefmt  = thisdate.split('/')  # Expecting yyyy/mm/dd
-    thisra   = ra[i].split(',')[0]
-    thisdec  = dec[i].split(',')[0]
-    if ((thisdate != 'nan') and (thisra != 'nan') and (thisdec != 'nan') and (len(datefmt) == 3)):# and (i != 28766)):  # <-- old formatting issue with i = 28766, but fine now
-        # Do not include any supernovae beyond the specified year
-        if (int(datefmt[0]) < endyear):
-            # Append the supernova to the list of "good" ones
-            igood.append(i)
+# Parse the discovery dates once into day numbers and fractional years (yyyy.yy)
+# ...malformed dates are masked out by parsedates() rather than fixed by hand
+days, time, gooddate = parsedates(date=date)
+year = days2ymd(days)[0]
+
+# Discard the supernovae without date information and/or RA/DEC information
+# Do not include any supernovae beyond the specified year
+igood = np.where(gooddate & ~np.isnan(ra) & ~np.isnan(dec) & (year < endyear))[0]
+print "Discarding ", int(np.sum(~gooddate)), " supernovae with missing or malformed dates"
+
+# Find the bursts of discoveries in the same (day, sky cell) and the exact duplicates among all of the good supernovae
+# ...in catalog order, including the ledger rows that were not processed again, so that this matches a full rebuild
+ifiltered = np.setdiff1d(np.arange(len(days)), igood)
+screened = {}
+filtered = {}
+for key, values in [('name', catname), ('date', date), ('rowhash', rowhash), ('days', days), ('ra', ra), ('dec', dec), ('icat', iproc)]:
+    screened[key] = values[igood]
+    filtered[key] = values[ifiltered]
+filtered['reason'] = np.zeros(len(ifiltered), dtype=np.uint8) + screenreasons.index('filtered')
+iscreened = np.arange(len(igood))  # Index into igood (-1 for the ledger rows)
+if (merge):
+    ilfiltered = (ledgerkept['reason'] == screenreasons.index('filtered'))
+    for key in screened: screened[key] = np.concatenate([screened[key], ledgerkept[key][~ilfiltered]])
+    for key in filtered: filtered[key] = np.concatenate([filtered[key], ledgerkept[key][ilfiltered]])
+    iscreened = np.concatenate([iscreened, np.zeros(np.sum(~ilfiltered), dtype=np.int64) - 1])
+icatorder = np.argsort(screened['icat'], kind='mergesort')
+for key in screened: screened[key] = screened[key][icatorder]
+iscreened = iscreened[icatorder]
+screened['reason'], Ncell = screen(days=screened['days'], ra=screened['ra'], dec=screened['dec'])
+
+# The new screening ledger of the output file: the screened rows and the ones that did not pass the filters
+ledger = {}
+for key in screened: ledger[key] = np.concatenate([screened[key], filtered[key]])
+icatorder = np.argsort(ledger['icat'], kind='mergesort')
+for key in ledger: ledger[key] = ledger[key][icatorder]
+rejected = (screened['reason'] != screenreasons.index('kept'))
+ibad = np.where(rejected)[0]
+writereport(freport=freport, name=screened['name'][ibad], date=screened['date'][ibad], ra=screened['ra'][ibad], dec=screened['dec'][ibad],
+            reason=np.array(screenreasons)[screened['reason'][ibad]], Ncell=Ncell[ibad])
+Nburst     = int(np.sum(screened['reason'] == screenreasons.index('burst')))
+Nduplicate = int(np.sum(screened['reason'] == screenreasons.index('duplicate')))
+print "Found ", Nburst, " supernovae in discovery bursts and ", Nduplicate, " duplicates (listed in ", freport, ")"
+if (rejectbursts):
+    igood = igood[np.sort(iscreened[~rejected & (iscreened >= 0)])]
+    # Supernovae already in the output file that are rejected now
+    if (merge): dropnames = np.concatenate([dropnames, screened['name'][rejected & (iscreened < 0)]])
 
 # Keep only the good supernovae
+time  = time[igood]
+days  = days[igood]
+year  = year[igood]
+rowhash = rowhash[igood]
 name  = name[igood]
 date  = date[igood]
 mmax  = mmax[igood]
@@ -91,19 +182,19 @@ ra    = ra[igood]
 dec   = dec[igood]
 z     = z[igood]
 type  = type[igood]
-
-# Loop through the supernovae with date info and sort chronologically
 Nlines = len(date)
-time   = np.zeros(Nlines)
-for i in np.arange(Nlines):
-    thisdate = date[i].split(',')[0]
-    if (i == 37187): thisdate = '1948/05/28'  # <-- formatting issue with i = 37187
-    print i, thisdate
-    time[i] = fractionalyear(yyyymmdd=thisdate)
-
-# Sort the supernovae data chronologically
-isort = np.argsort(time)
+if (merge and (Nlines == 0)):
+    mergesndata(fh5=fh5, data=None, dropnames=dropnames)
+    writescreen(fh5=fh5, screen=ledger, settings=settings)
+    if (farrow != None): writearrow(fout=farrow, data=readsndata(fh5=fh5))
+    quit()
+
+# Sort the supernovae data chronologically (the supernovae discovered on the same day by name, see sndata.sortorder())
+isort = sortorder(days=days, name=name, rowhash=rowhash)
 time  = time[isort]
+days  = days[isort]
+year  = year[isort]
+rowhash = rowhash[isort]
 name  = name[isort]
 date  = date[isort]
 mmax  = mmax[isort]
@@ -113,38 +204,11 @@ dec   = dec[isort]
 z     = z[isort]
 type  = type[isort]
 
-# Only keep the first entries of the data
-# ...(may want to average all entries or something like that in the future)...
-for i in np.arange(Nlines):
-    #time[i] = time[i].split(',')[0]  <-- cannot split floats
-    name[i] = name[i].split(',')[0]
-    date[i] = date[i].split(',')[0]
-    #mmax[i] = mmax[i].split(',')[0]  <-- cannot split floats
-    host[i] = host[i].split(',')[0]
-    ra[i]   = ra[i].split(',')[0]
-    dec[i]  = dec[i].split(',')[0]
-    z[i]    = z[i].split(',')[0]
-    type[i] = type[i].split(',')[0]
-
-# Fill in NaN apparent magnitudes with the mean value
-mmax_mean = np.nanmean(mmax)  # Mean apparent AB magnitude
-mmax_min  = np.nanmin(mmax)   # Brightest apparent AB magnitude
-mmax_max  = np.nanmax(mmax)   # Dimmest apparent AB magnitude
-for i in np.arange(Nlines):
-    if (np.isnan(mmax[i])):
-        mmax[i] = mmax_mean
-    #if (mmax[i] < 6.5):  # Magnitude 6.5 is just visible to the human eye
-    #    print "This SN was visible by eye: ", name[i]
-
 # Toss out the 12 supernovae prior to 1900
-ikeep = []
-for i in np.arange(Nlines):
-    # This is a hack because datetime does not like pre-1900 dates
-    thisyear = int(date[i].split('/')[0])
-    if (thisyear >= 1900):
-        thisdate = datetime.strptime(date[i], '%Y/%m/%d')
-        ikeep.append(i)
+ikeep = np.where(year >= 1900)[0]
 time  = time[ikeep]
+days  = days[ikeep]
+rowhash = rowhash[ikeep]
 name  = name[ikeep]
 date  = date[ikeep]
 mmax  = mmax[ikeep]
@@ -157,57 +221,44 @@ type  = type[ikeep]
 # New number of lines in the dataset after truncating dates < 1900
 Nlines = len(date)
 
-# THIS NEXT BIT TAKES UP THE MOST AMOUNT OF COMPUTING TIME
-# Collect the RA/DEC for each supernova in units of [degrees]
-# RA  : [  0.0d, 360.0d]
-# DEC : [-90.0d, +90.0d]
-ra_list = []
-dec_list = []
-l_list = []
-b_list = []
-for i in np.arange(Nlines):
-    radec = coord.SkyCoord(ra[i], dec[i], unit=(u.hour, u.deg), frame='icrs')
-    ra_list.append(radec.ra.deg)    # [degrees]
-    dec_list.append(radec.dec.deg)  # [degrees]
-    # Galactic coordinates (l,b)
-    lonlat = radec.transform_to('galactic')
-    l_list.append(lonlat.l.deg)  # [degrees]
-    b_list.append(lonlat.b.deg)  # [degrees]
-
-# Convert RA/DEC from [degrees] to angular coordinates [degrees:arcmin:arcsec]
-# RA  : [  0d:00m:00.0s, +360d:00m:00.0s]
-# DEC : [-90d:00m:00.0s,  +90d:00m:00.0s]
-ra_list  = coord.Angle(ra_list * u.degree)
-dec_list = coord.Angle(dec_list * u.degree)
-l_list   = coord.Angle(l_list * u.degree)
-b_list   = coord.Angle(b_list * u.degree)
-
-# Bound RA/DEC to conform to our plotting coordinate range [degrees:arcmin:arcsec]
+# Fill in NaN apparent magnitudes with the mean value of the supernovae we keep
+# ...mergesndata() refills them over the same population (and the same way), so incremental updates match a full rebuild
+mmax_filled = np.isnan(mmax)  # Keep track of which ones were filled in (needed for incremental updates)
+mmax_mean = np.mean(mmax[~mmax_filled])  # Mean apparent AB magnitude
+mmax_min  = np.min(mmax[~mmax_filled])   # Brightest apparent AB magnitude
+mmax_max  = np.max(mmax[~mmax_filled])   # Dimmest apparent AB magnitude
+mmax[mmax_filled] = mmax_mean
+#print "These SNe were visible by eye: ", name[mmax < 6.5]  # Magnitude 6.5 is just visible to the human eye
+
+# Collect the RA/DEC and Galactic (l,b) for all of the supernovae at once, bounded to our plotting range [radians]
 # RA  : [-180d:00m:00.0s, +180d:00m:00.0s]
 # DEC : [ -90d:00m:00.0s,  +90d:00m:00.0s]
-ra_list  = ra_list.wrap_at(180.0 * u.degree)
-dec_list = dec_list.wrap_at(90.0 * u.degree)
-l_list   = l_list.wrap_at(180.0 * u.degree)
-b_list   = b_list.wrap_at(90.0 * u.degree)
-
-# Convert RA/DEC to radians
-ra_list = ra_list.radian
-dec_list = dec_list.radian
-l_list   = l_list.radian
-b_list   = b_list.radian
-
-# Write out the results to an HDF5 file
-f = h5py.File(fh5, 'w')
-f.create_dataset('time', data=time)  # yyyy.yy
-f.create_dataset('name', data=name)
-f.create_dataset('date', data=date)  # 'yyyy/mm/dd'
-f.create_dataset('mmax', data=mmax)
-f.create_dataset('host', data=host)
-f.create_dataset('ra',   data=ra_list)   # [-180d:00m:00.0s, +180d:00m:00.0s]
-f.create_dataset('dec',  data=dec_list)  # [ -90d:00m:00.0s,  +90d:00m:00.0s]
-f.create_dataset('l',    data=l_list)    # [-180d:00m:00.0s, +180d:00m:00.0s]
-f.create_dataset('b',    data=b_list)    # [ -90d:00m:00.0s,  +90d:00m:00.0s]
-f.create_dataset('z',    data=z)
-f.create_dataset('type', data=type)
-f.close()
+ra_list, dec_list, l_list, b_list = radec2galactic(ra=ra, dec=dec, unit='deg')
+
+# Write out the results to an HDF5 file (or merge them into the existing one)
+data = {}
+data['time'] = time      # yyyy.yy
+data['days'] = days      # Days since 1970/01/01
+data['name'] = name
+data['date'] = date      # 'yyyy/mm/dd'
+data['mmax'] = mmax
+data['host'] = host
+data['ra']   = ra_list   # [-180d:00m:00.0s, +180d:00m:00.0s]
+data['dec']  = dec_list  # [ -90d:00m:00.0s,  +90d:00m:00.0s]
+data['l']    = l_list    # [-180d:00m:00.0s, +180d:00m:00.0s]
+data['b']    = b_list    # [ -90d:00m:00.0s,  +90d:00m:00.0s]
+data['z']    = z
+data['type'] = type
+data['mmax_filled'] = mmax_filled
+data['rowhash']     = rowhash
+if (merge):
+    Nadded, Ndropped = mergesndata(fh5=fh5, data=data, dropnames=dropnames)
+    print "Merged into ", fh5, ": ", Nadded, " added, ", Ndropped, " removed"
+else:
+    writesndata(fh5=fh5, data=data)
+writescreen(fh5=fh5, screen=ledger, settings=settings)
 
+# Export the full (merged) dataset to a columnar file
+if (farrow != None):
+    writearrow(fout=farrow, data=readsndata(fh5=fh5))
+    print "Exported the SNe data to ", farrow
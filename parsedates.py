@@ -0,0 +1,156 @@
+import numpy as np
+
+'''
+Procedure:
+----------
+Parse a whole column of "yyyy/mm/dd" discovery dates in a single pass.
+
+Output:
+-------
+Integer day numbers (days since 1970/01/01), fractional years (yyyy.yy), and a mask of the valid dates.
+
+Notes:
+------
+The calendar arithmetic is done with integers on whole arrays (proleptic Gregorian calendar),
+so there are no restrictions on the year like there are with datetime.strptime().
+Malformed dates (e.g., partial dates like "yyyy/mm", stray characters, impossible days) are masked out.
+Only the first entry of a multi-valued date (e.g., "yyyy/mm/dd,yyyy/mm/dd") is parsed.
+'''
+
+# Placeholder day number given to the masked (invalid) dates
+badday = np.iinfo(np.int64).min
+
+#====================================================================================================
+# Convert arrays of year, month, day integers into day numbers (days since 1970/01/01)
+def ymd2days(year, month, day):
+    '''
+    Inputs:
+    -------
+    year, month, day - Integer arrays (or scalars) of the calendar date
+
+    Outputs:
+    --------
+    days - Day numbers (int64)
+    '''
+    year  = np.asarray(year, dtype=np.int64)
+    month = np.asarray(month, dtype=np.int64)
+    day   = np.asarray(day, dtype=np.int64)
+    year  = year - (month <= 2)
+    era   = year // 400
+    yoe   = year - era * 400                         # Year of the era [0, 399]
+    doy   = (153 * ((month + 9) % 12) + 2) // 5 + day - 1  # Day of the year (starting from March 1st)
+    doe   = yoe * 365 + yoe // 4 - yoe // 100 + doy  # Day of the era [0, 146096]
+    return era * 146097 + doe - 719468
+
+
+#====================================================================================================
+# Convert an array of day numbers (days since 1970/01/01) into year, month, day integer arrays
+def days2ymd(days):
+    '''
+    Inputs:
+    -------
+    days - Day numbers (int64)
+
+    Outputs:
+    --------
+    year, month, day - Integer arrays of the calendar date
+    '''
+    days  = np.asarray(days, dtype=np.int64) + 719468
+    era   = days // 146097
+    doe   = days - era * 146097
+    yoe   = (doe - doe // 1460 + doe // 36524 - doe // 146096) // 365
+    doy   = doe - (365 * yoe + yoe // 4 - yoe // 100)
+    mp    = (5 * doy + 2) // 153
+    day   = doy - (153 * mp + 2) // 5 + 1
+    month = np.where(mp < 10, mp + 3, mp - 9)
+    year  = yoe + era * 400 + (month <= 2)
+    return year, month, day
+
+
+#====================================================================================================
+# Convert a datetime.datetime() object into a (fractional) day number
+def datetime2days(dateobj):
+    '''
+    Inputs:
+    -------
+    dateobj - A datetime.datetime() object
+
+    Outputs:
+    --------
+    days - Days since 1970/01/01 (float, includes the fraction of the day)
+    '''
+    seconds = dateobj.hour * 3600.0 + dateobj.minute * 60.0 + dateobj.second + dateobj.microsecond * 1.0e-6
+    return float(ymd2days(dateobj.year, dateobj.month, dateobj.day)) + seconds / 86400.0
+
+
+#====================================================================================================
+# Convert day numbers into fractional years (yyyy.yy)
+def days2yearfrac(days):
+    '''
+    Inputs:
+    -------
+    days - Day numbers (int64)
+
+    Outputs:
+    --------
+    yearfrac - Fractional years (e.g., 1987.15)
+    '''
+    year, month, day = days2ymd(days)
+    year0 = ymd2days(year, 1, 1)
+    year1 = ymd2days(year + 1, 1, 1)
+    return year + (np.asarray(days) - year0) / (year1 - year0).astype(np.float64)
+
+
+#====================================================================================================
+# Parse a column of "yyyy/mm/dd" strings into day numbers, fractional years, and a validity mask
+def parsedates(date):
+    '''
+    Inputs:
+    -------
+    date - Array of dates in "yyyy/mm/dd" string format (missing values may be 'nan')
+
+    Outputs:
+    --------
+    days, yearfrac, valid - Day numbers (int64, badday where invalid),
+                            Fractional years (NaN where invalid),
+                            Boolean mask of the valid dates
+    '''
+    # Keep only the first entry, then split into the year, month, day strings
+    date  = np.char.strip(np.asarray(date).astype(str))
+    if (len(date) == 0): return np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0, dtype=bool)
+    first = np.char.partition(date, ',')[..., 0]
+    ymd   = np.char.partition(first, '/')
+    md    = np.char.partition(ymd[..., 2], '/')
+    yyyy  = ymd[..., 0]
+    mm    = md[..., 0]
+    dd    = md[..., 2]
+
+    # Every part has to be made of digits (this also rejects 'nan', partial dates, and extra '/' fields)
+    valid = np.char.isdigit(yyyy) & np.char.isdigit(mm) & np.char.isdigit(dd)
+    year  = np.where(valid, yyyy, '0').astype(np.int64)
+    month = np.where(valid, mm, '1').astype(np.int64)
+    day   = np.where(valid, dd, '1').astype(np.int64)
+
+    # Reject impossible calendar dates (e.g., month 13, February 30th)
+    valid = valid & (month >= 1) & (month <= 12) & (day >= 1)
+    days  = ymd2days(year, month, day)
+    valid = valid & (days2ymd(days)[2] == day)
+
+    yearfrac = np.where(valid, days2yearfrac(days), np.nan)
+    days     = np.where(valid, days, badday)
+    return days, yearfrac, valid
+
+
+#====================================================================================================
+# Convert day numbers into numpy datetime64 objects
+def days2datetime64(days):
+    '''
+    Inputs:
+    -------
+    days - Day numbers (int64)
+
+    Outputs:
+    --------
+    Array of datetime64[D] dates (NaT where the day number is badday)
+    '''
+    return np.asarray(days, dtype=np.int64).astype('datetime64[D]')
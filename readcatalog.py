@@ -0,0 +1,160 @@
+import sys
+import csv
+import time
+import numpy as np
+from operator import itemgetter
+
+'''
+Procedure:
+----------
+Read only the columns we need from The_Open_Supernova_Catalog.csv with explicit data types.
+
+Output:
+-------
+Dictionary of numpy arrays keyed by the column names, filled the same way as organizedata.py used to
+(missing strings --> 'nan', missing floats --> NaN).
+
+Notes:
+------
+The CSV tokenizing and column selection are done by the C-level csv module and operator.itemgetter,
+so there is no per-row Python code. The string-to-float conversions are done by numpy on whole columns.
+Run this file directly to benchmark it against the old astropy.io.ascii path.
+'''
+
+# Columns needed from the catalog and their data types (everything else is a string)
+catcols   = ['Name', 'Disc. Date', 'mmax', 'Host Name', 'R.A.', 'Dec.', 'z', 'Type']
+catdtypes = {'mmax': np.float64}
+
+#====================================================================================================
+# Read the requested columns from the Open Supernova Catalog CSV file
+def readcatalog(fcsv, cols=catcols, dtypes=catdtypes):
+    '''
+    Inputs:
+    -------
+    fcsv   - Filename for the Open Supernova Catalog CSV file
+    cols   - List of column names to keep
+    dtypes - Dictionary of numpy data types for any non-string columns
+
+    Outputs:
+    --------
+    table - Dictionary of numpy arrays, one for each column in cols
+    '''
+    if (sys.version_info[0] < 3): fobj = open(fcsv, 'rb')
+    else: fobj = open(fcsv, 'r', newline='', encoding='utf-8')
+    reader = csv.reader(fobj)
+
+    # Find where our columns are in the header
+    header = next(reader)
+    icols  = [header.index(col) for col in cols]
+
+    # Pull out only the columns we need and transpose the rows into columns
+    rows = list(map(itemgetter(*icols), reader))
+    fobj.close()
+    if (len(cols) == 1): rows = [(row,) for row in rows]
+    if (len(rows) > 0): columns = list(zip(*rows))
+    else: columns = [()] * len(cols)
+
+    # Convert each column to its data type, filling in the missing values with NaN's
+    table = {}
+    for col, values in zip(cols, columns):
+        values = fillmissing(np.array(values, dtype=str))
+        if (col in dtypes): table[col] = str2float(values).astype(dtypes[col])
+        else: table[col] = values
+    return table
+
+
+#====================================================================================================
+# Replace the missing (empty) strings with 'nan'
+# ...np.where widens the strings as needed (assigning 'nan' in place would truncate it to the width of the column, e.g. 'na')
+def fillmissing(values):
+    return np.where(values == '', 'nan', values)
+
+
+#====================================================================================================
+# Convert an array of strings to floats (only the first entry of multi-valued strings is used)
+def str2float(values):
+    '''
+    Inputs:
+    -------
+    values - Array of strings (e.g., '17.3' or '17.3,17.5')
+
+    Outputs:
+    --------
+    Array of floats (NaN for anything that cannot be converted)
+    '''
+    if (len(values) == 0): return np.zeros(0)
+    values = fillmissing(np.char.strip(np.char.partition(np.asarray(values, dtype=str), ',')[..., 0]))
+    try:
+        return values.astype(np.float64)
+    except ValueError:
+        # Fall back on converting element by element when there are non-numeric entries
+        floats = np.zeros(len(values))
+        for i in np.arange(len(values)):
+            try: floats[i] = float(values[i])
+            except ValueError: floats[i] = np.nan
+        return floats
+
+
+#====================================================================================================
+# Read the catalog the old way, with astropy.io.ascii
+def readcatalog_astropy(fcsv, cols=catcols):
+    '''
+    Inputs:
+    -------
+    fcsv - Filename for the Open Supernova Catalog CSV file
+    cols - List of column names to keep
+
+    Outputs:
+    --------
+    table - Dictionary of arrays, one for each column in cols (filled with NaN's)
+    '''
+    from astropy.io import ascii
+    atable = ascii.read(fcsv, header_start=0, data_start=1)
+    table  = {}
+    for col in cols:
+        column = atable[col]
+        if (hasattr(column, 'filled')): column = column.filled(np.nan)
+        table[col] = np.asarray(column)
+    return table
+
+
+#====================================================================================================
+# Benchmark the column-selective reader against the astropy reader
+def benchmark(fcsv, Nrepeat=3):
+    '''
+    Inputs:
+    -------
+    fcsv    - Filename for the Open Supernova Catalog CSV file
+    Nrepeat - Number of times to read the file with each reader (the fastest time is reported)
+
+    Outputs:
+    --------
+    t_fast, t_astropy - Fastest read times [seconds]
+    '''
+    t_fast    = []
+    t_astropy = []
+    for i in np.arange(Nrepeat):
+        t0 = time.time()
+        fast = readcatalog(fcsv=fcsv)
+        t_fast.append(time.time() - t0)
+        t0 = time.time()
+        slow = readcatalog_astropy(fcsv=fcsv)
+        t_astropy.append(time.time() - t0)
+
+    # Check that both readers give the same columns
+    Nrows = len(fast['Name'])
+    print("\nRead %d rows from %s\n" % (Nrows, fcsv))
+    for col in catcols:
+        if (col in catdtypes): same = np.allclose(fast[col], slow[col], equal_nan=True)
+        else: same = np.all(fast[col] == np.asarray(slow[col]).astype(str))
+        print("    %-10s : %s" % (col, 'match' if same else 'MISMATCH'))
+    print("\n    readcatalog()         : %.3f seconds (%.0f rows/s)" % (min(t_fast), Nrows / min(t_fast)))
+    print("    readcatalog_astropy() : %.3f seconds (%.0f rows/s)" % (min(t_astropy), Nrows / min(t_astropy)))
+    print("    Speed-up factor       : %.1f\n" % (min(t_astropy) / min(t_fast)))
+    return min(t_fast), min(t_astropy)
+
+
+if __name__ == "__main__":
+    fcsv = "/Users/salvesen/outreach/asom/supernovae/data/The_Open_Supernova_Catalog.csv"
+    if (len(sys.argv) > 1): fcsv = sys.argv[1]
+    benchmark(fcsv=fcsv)
@@ -0,0 +1,172 @@
+import os
+import sys
+import json
+import time
+import gzip
+import numpy as np
+from multiprocessing import Pool, cpu_count
+from readcatalog import catcols, fillmissing
+
+'''
+Procedure:
+----------
+Read the same fields as the Open Supernova Catalog CSV export from a local directory of per-object
+OSC JSON files (e.g., clones of the sne-* repositories), parsing the files in a pool of processes.
+
+Output:
+-------
+Dictionary of numpy string arrays keyed by the CSV column names, exactly like readcatalog(dtypes={}),
+so the rest of organizedata.py (and the SNedata.h5 schema) does not change.
+
+Notes:
+------
+Each JSON file holds one (or more) objects keyed by name, where every quantity is a list of
+{"value": ..., "source": ...} entries from the different sources. The values of each quantity are
+joined with commas, which is how the CSV export stores multi-valued fields, so reducefields.py can
+reduce them in the same way. RA values given in degrees (rather than hours) are converted to hours.
+The files are handed out to the worker processes in chunks and the rows are collected as they come back.
+Files that cannot be read or parsed are skipped and reported.
+'''
+
+# JSON quantities for each of the CSV columns
+jsonfields = {'Name': 'name', 'Disc. Date': 'discoverdate', 'mmax': 'maxappmag', 'Host Name': 'host',
+              'R.A.': 'ra', 'Dec.': 'dec', 'z': 'redshift', 'Type': 'claimedtype'}
+
+#====================================================================================================
+# Find all of the OSC JSON files in a directory (and its subdirectories)
+def findjson(jsondir):
+    '''
+    Inputs:
+    -------
+    jsondir - Directory of OSC JSON files ('.json' or '.json.gz')
+
+    Outputs:
+    --------
+    fjsons - Sorted list of the JSON filenames
+    '''
+    fjsons = []
+    for root, dirs, files in os.walk(jsondir):
+        for fname in files:
+            if (fname.endswith('.json') or fname.endswith('.json.gz')): fjsons.append(os.path.join(root, fname))
+    return sorted(fjsons)
+
+
+#====================================================================================================
+# Join the values of a quantity for one object into a single comma-separated string
+def jsonvalue(obj, name, quantity):
+    '''
+    Inputs:
+    -------
+    obj      - Dictionary of the quantities for one object
+    name     - Name of the object (its key in the JSON file)
+    quantity - JSON quantity (e.g., 'discoverdate')
+
+    Outputs:
+    --------
+    String of the comma-separated values ('' if there are none)
+    '''
+    if (quantity == 'name'): entries = [obj.get('name', name)]
+    else: entries = obj.get(quantity, [])
+    if (not isinstance(entries, list)): entries = [entries]
+    values = []
+    for entry in entries:
+        if (isinstance(entry, dict)):
+            value = entry.get('value', '')
+            if ((quantity == 'ra') and (entry.get('u_value', 'hours') == 'degrees')):
+                try: value = '%.10f' % (float(value) / 15.0)
+                except ValueError: pass
+        else:
+            value = entry
+        if ((sys.version_info[0] < 3) and isinstance(value, type(u''))): value = value.encode('utf-8')
+        value = str(value).strip()
+        if ((value != '') and (value not in values)): values.append(value)
+    return ','.join(values)
+
+
+#====================================================================================================
+# Parse a chunk of OSC JSON files into rows of strings (run by each worker process)
+def parsejsonchunk(args):
+    '''
+    Inputs:
+    -------
+    args - Tuple of (list of JSON filenames, list of JSON quantities to extract)
+
+    Outputs:
+    --------
+    rows, bad - List of tuples of strings (one per object), List of the files that could not be parsed
+    '''
+    fjsons, quantities = args
+    rows = []
+    bad  = []
+    for fjson in fjsons:
+        try:
+            if (fjson.endswith('.gz')): fobj = gzip.open(fjson, 'rb')
+            else: fobj = open(fjson, 'rb')
+            objs = json.loads(fobj.read().decode('utf-8'))
+            fobj.close()
+        except (IOError, ValueError):
+            bad.append(fjson)
+            continue
+        for name, obj in objs.items():
+            rows.append(tuple([jsonvalue(obj=obj, name=name, quantity=quantity) for quantity in quantities]))
+    return rows, bad
+
+
+#====================================================================================================
+# Read the requested columns from a directory of OSC JSON files
+def readjsondir(jsondir, cols=catcols, extras=None, Nproc=None, Nchunk=64):
+    '''
+    Inputs:
+    -------
+    jsondir - Directory of OSC JSON files
+    cols    - List of CSV column names to extract (see jsonfields)
+    extras  - Dictionary of any extra columns to extract, e.g., {'Max Date': 'maxdate', 'Lum. Dist.': 'lumdist'}
+    Nproc   - Number of worker processes (default is the number of CPUs, 1 to parse in this process)
+    Nchunk  - Number of files to hand a worker process at a time
+
+    Outputs:
+    --------
+    table - Dictionary of numpy string arrays, one for each column in cols (plus extras), missing values are 'nan'
+    '''
+    fields = dict(jsonfields)
+    if (extras != None): fields.update(extras)
+    allcols    = list(cols) + [col for col in (extras or {}).keys() if (col not in cols)]
+    quantities = [fields[col] for col in allcols]
+
+    # Parse the files in chunks, collecting the rows as each chunk comes back
+    fjsons = findjson(jsondir)
+    chunks = [(fjsons[i0:i0+Nchunk], quantities) for i0 in np.arange(0, len(fjsons), Nchunk)]
+    if (Nproc == None): Nproc = cpu_count()
+    rows = []
+    bad  = []
+    if ((Nproc > 1) and (len(chunks) > 1)):
+        pool = Pool(processes=min(Nproc, len(chunks)))
+        for chunkrows, chunkbad in pool.imap(parsejsonchunk, chunks):
+            rows.extend(chunkrows)
+            bad.extend(chunkbad)
+        pool.close()
+        pool.join()
+    else:
+        for chunk in chunks:
+            chunkrows, chunkbad = parsejsonchunk(chunk)
+            rows.extend(chunkrows)
+            bad.extend(chunkbad)
+    if (len(bad) > 0):
+        print("Could not parse %d of the %d JSON files, e.g., %s" % (len(bad), len(fjsons), str(bad[:5])))
+
+    # Transpose the rows into columns, filling in the missing values with 'nan'
+    if (len(rows) > 0): columns = list(zip(*rows))
+    else: columns = [()] * len(allcols)
+    table = {}
+    for col, values in zip(allcols, columns):
+        table[col] = fillmissing(np.array(values, dtype=str))
+    return table
+
+
+if __name__ == "__main__":
+    jsondir = "/Users/salvesen/outreach/asom/supernovae/data/osc-json/"
+    if (len(sys.argv) > 1): jsondir = sys.argv[1]
+    for Nproc in [1, cpu_count()]:
+        t0 = time.time()
+        table = readjsondir(jsondir=jsondir, Nproc=Nproc)
+        print("Read %d objects with %d process(es) in %.2f seconds" % (len(table['Name']), Nproc, time.time() - t0))
@@ -0,0 +1,142 @@
+import numpy as np
+from readcatalog import str2float
+from skycoords import str2deg
+
+'''
+Procedure:
+----------
+Reduce the multi-valued (comma-separated) catalog fields to a single value per supernova.
+
+Output:
+-------
+Dictionary of reduced columns keyed by the catalog column names.
+
+Notes:
+------
+Each column is split only once, into a flat array of all of its entries plus an array of offsets
+marking where each supernova's entries start (a "ragged" layout, e.g., entries [offsets[i]:offsets[i+1]]).
+The reductions are then done with np.ufunc.reduceat() on whole arrays, so there is no per-row Python code.
+
+Reducers:
+    'first'  - Keep the first entry (what organizedata.py has always done; the only option for text fields)
+    'mean'   - Average all of the valid entries
+    'median' - Median of all of the valid entries
+    'min'    - Smallest of the valid entries
+The numerical reducers are available for 'mmax', 'z', 'R.A.' and 'Dec.' (RA is averaged around the circle).
+'''
+
+# Available reducers
+reducers = ['first', 'mean', 'median', 'min']
+
+# Numerical fields and how to convert their entries to floats
+numfields = {'mmax': 'float', 'z': 'float', 'R.A.': 'hour', 'Dec.': 'deg'}
+
+#====================================================================================================
+# Split every entry of a column at the commas
+def splitfield(values):
+    '''
+    Inputs:
+    -------
+    values - Array of (possibly comma-separated) strings
+
+    Outputs:
+    --------
+    flat, offsets - Array of all of the entries, Offsets into flat (length is len(values)+1)
+    '''
+    values  = np.asarray(values).astype(str)
+    Nvalues = len(values)
+    offsets = np.zeros(Nvalues + 1, dtype=np.int64)
+    if (Nvalues == 0): return np.array([], dtype=str), offsets
+    offsets[1:] = np.cumsum(np.char.count(values, ',') + 1)
+    flat = np.char.strip(np.array(','.join(values).split(','), dtype=str))
+    return flat, offsets
+
+
+#====================================================================================================
+# Reduce a flat array of numbers to one value per supernova
+def reducefloats(flat, offsets, reducer='first', period=None):
+    '''
+    Inputs:
+    -------
+    flat    - Array of floats (NaN for missing entries)
+    offsets - Offsets into flat for each supernova (output of splitfield())
+    reducer - One of 'first', 'mean', 'median', 'min'
+    period  - Period for circular quantities (e.g., 360.0 for RA in degrees), None otherwise
+
+    Outputs:
+    --------
+    Array of reduced values (NaN where a supernova has no valid entries)
+    '''
+    if (reducer not in reducers):
+        raise ValueError("Unknown reducer '" + str(reducer) + "', choose from " + str(reducers))
+    flat   = np.asarray(flat, dtype=np.float64)
+    starts = offsets[:-1]
+    counts = np.diff(offsets)
+    if (len(starts) == 0): return np.array([])
+    if (reducer == 'first'): return flat[starts]
+    if (reducer == 'min'): return np.fmin.reduceat(flat, starts)
+
+    # For circular quantities, work with the offsets from each supernova's smallest entry
+    if (period != None):
+        ref  = np.fmin.reduceat(flat, starts)
+        flat = (flat - np.repeat(ref, counts) + 0.5 * period) % period - 0.5 * period
+
+    valid  = ~np.isnan(flat)
+    Nvalid = np.add.reduceat(valid.astype(np.int64), starts)
+    if (reducer == 'mean'):
+        sums    = np.add.reduceat(np.where(valid, flat, 0.0), starts)
+        reduced = sums / np.maximum(Nvalid, 1)
+    if (reducer == 'median'):
+        # Sort the entries within each supernova (invalid entries go last), then pick out the middle one(s)
+        rowid   = np.repeat(np.arange(len(starts)), counts)
+        isort   = np.lexsort((np.where(valid, flat, np.inf), rowid))
+        sflat   = flat[isort]
+        ilo     = starts + np.maximum(Nvalid - 1, 0) // 2
+        ihi     = starts + Nvalid // 2
+        reduced = 0.5 * (sflat[ilo] + sflat[ihi])
+    reduced[Nvalid == 0] = np.nan
+
+    if (period != None): reduced = (reduced + ref) % period
+    return reduced
+
+
+#====================================================================================================
+# Reduce all of the catalog columns to one value per supernova
+def reducecatalog(table, fieldreducers):
+    '''
+    Inputs:
+    -------
+    table         - Dictionary of catalog columns of strings (output of readcatalog.readcatalog(dtypes={}))
+    fieldreducers - Dictionary of reducers for each column (columns not listed use 'first')
+
+    Outputs:
+    --------
+    reduced - Dictionary of reduced columns
+              Text fields and 'z' stay as strings ('nan' for missing values),
+              'mmax' becomes floats, and 'R.A.'/'Dec.' become floats [degrees]
+    '''
+    reduced = {}
+    for col in table.keys():
+        reducer = fieldreducers.get(col, 'first')
+        strflat, offsets = splitfield(table[col])
+        if (col not in numfields):
+            if (reducer != 'first'):
+                raise ValueError("Column '" + col + "' is not numerical, so it can only use the 'first' reducer")
+            reduced[col] = strflat[offsets[:-1]]
+            continue
+
+        # Convert the entries to floats
+        if (numfields[col] == 'float'): flat = str2float(strflat)
+        else: flat = str2deg(strflat, unit=numfields[col])
+
+        # Reduce the entries (RA is an angle around the circle)
+        if (col == 'R.A.'): period = 360.0
+        else: period = None
+        values = reducefloats(flat=flat, offsets=offsets, reducer=reducer, period=period)
+
+        # Redshifts have always been stored as strings
+        if (col == 'z'):
+            if (reducer == 'first'): values = strflat[offsets[:-1]]
+            else: values = np.char.mod('%.15g', values)
+        reduced[col] = values
+    return reduced
@@ -0,0 +1,331 @@
+import os
+import sys
+import time
+import warnings
+import numpy as np
+import astropy.units as u
+import astropy.coordinates as coord
+
+'''
+Procedure:
+----------
+Convert the RA/DEC strings of the supernovae into ICRS and Galactic coordinates, all at once.
+
+Notes:
+------
+Building one SkyCoord per supernova and transforming it to Galactic coordinates row by row was
+the slowest part of organizedata.py. Here we hand astropy whole arrays (in chunks, to keep the
+memory footprint bounded for very large catalogs) and do the wrapping/radian conversions on arrays.
+
+The "hh:mm:ss.s" / "+dd:mm:ss.s" strings are parsed by our own numpy string-array parser rather than
+astropy's generic angle parser. Anything the fast parser does not recognize (e.g., "12h30m00s") is
+handed to astropy, and whatever astropy cannot parse either is reported and set to NaN.
+Both parsers only accept valid right ascensions (unit='hour', less than 24 hours) and declinations
+(unit='deg', within +/-90 degrees), and only the last field of a string can have a fractional part.
+Run this file directly to check both parsers against astropy on a fixture of catalog-style strings (see
+checkparser()), and on the whole catalog if it is there, which also benchmarks the fast parser.
+'''
+
+# Fixture of catalog-style RA/DEC strings for checkparser(): (string, unit, whether it is a valid angle)
+# ...including sign-only negative declinations, fractional fields, out-of-range fields, and non-sexagesimal formats
+checkstrings = [('00:00:00.000', 'hour', True), ('12:30:45.123', 'hour', True), ('23:59:59.999', 'hour', True),
+                ('05:34:31.94', 'hour', True), ('12:30', 'hour', True), ('12:30.5', 'hour', True),
+                ('12.5', 'hour', True), ('12h30m45.1s', 'hour', True), ('24:00:00', 'hour', False),
+                ('25:10:00', 'hour', False), ('12:60:00', 'hour', False), ('12:30:60', 'hour', False),
+                ('12.5:30:00', 'hour', False), ('12:3.5:00', 'hour', False), ('12:xx:00', 'hour', False),
+                ('+00:00:00', 'deg', True), ('-00:30:00', 'deg', True), ('-00:00:01.5', 'deg', True),
+                ('-0:30', 'deg', True), ('-00:45.25', 'deg', True), ('+89:59:59.99', 'deg', True),
+                ('-90:00:00', 'deg', True), ('+90:00:00', 'deg', True), ('-12.345', 'deg', True),
+                ('+45d30m00s', 'deg', True), ('+90:00:01', 'deg', False), ('-91:00:00', 'deg', False),
+                ('+45:60:00', 'deg', False), ('+45:30:60', 'deg', False), ('+45.5:30:00', 'deg', False),
+                ('+45:30.5:00', 'deg', False), ('+-45:30:00', 'deg', False)]
+
+#====================================================================================================
+# Check that an array of strings are (unsigned) decimal numbers, e.g., "12", "12.", "12.345"
+def isdecimal(values):
+    '''
+    Inputs:
+    -------
+    values - Array of strings
+
+    Outputs:
+    --------
+    Boolean mask of the strings that are decimal numbers
+    '''
+    return np.char.isdigit(np.char.replace(values, '.', '', 1)) & ~np.char.startswith(values, '.')
+
+
+#====================================================================================================
+# Check that angles are valid right ascensions (unit='hour', less than 24 hours) or declinations (unit='deg', within +/-90 degrees)
+def inrange(deg, unit='deg'):
+    if (unit == 'hour'): return np.abs(deg) < 360.0
+    return np.abs(deg) <= 90.0
+
+
+#====================================================================================================
+# Parse one sexagesimal string with astropy (the fallback for parsesexagesimal(), and the reference it is checked against)
+def astropydeg(value, unit='deg'):
+    '''
+    Inputs:
+    -------
+    value - String of an angle in any format that astropy.coordinates.Angle() understands
+    unit  - Unit of the first field in the string ('hour' or 'deg')
+
+    Outputs:
+    --------
+    Angle [degrees] (raises an exception if the string cannot be parsed or the angle is out of range)
+    '''
+    with warnings.catch_warnings():
+        # e.g., "24:00:00" and "12:60:00" are only warnings
+        for warning in [coord.IllegalHourWarning, coord.IllegalMinuteWarning, coord.IllegalSecondWarning]:
+            warnings.simplefilter('error', warning)
+        deg = coord.Angle(value, unit=u.Unit(unit.replace('hour', 'hourangle'))).deg
+    if (not inrange(deg, unit=unit)): raise ValueError("Angle '" + str(value) + "' is out of range for unit '" + unit + "'")
+    return deg
+
+
+#====================================================================================================
+# Parse an array of sexagesimal strings with numpy string operations
+def parsesexagesimal(values, unit='deg'):
+    '''
+    Inputs:
+    -------
+    values - Array of "hh:mm:ss.s" (unit='hour') or "+dd:mm:ss.s" (unit='deg') strings
+             (the seconds and minutes fields are optional, e.g., "+dd:mm" or "dd.ddd")
+    unit   - Unit of the first field in the strings ('hour' for RA, or 'deg' for DEC, see inrange())
+
+    Outputs:
+    --------
+    deg, valid - Array of angles [degrees] (NaN where invalid), Boolean mask of the parsed strings
+    '''
+    values = np.char.strip(np.asarray(values).astype(str))
+    if (len(values) == 0): return np.zeros(0), np.zeros(0, dtype=bool)
+
+    # Split into the (signed) first field, minutes, and seconds
+    dms  = np.char.partition(values, ':')
+    ms   = np.char.partition(dms[..., 2], ':')
+    dstr = dms[..., 0]
+    mstr = ms[..., 0]
+    sstr = ms[..., 2]
+
+    # The sign applies to the whole angle (e.g., "-00:30:00" is -0.5 degrees)
+    neg    = np.char.startswith(dstr, '-')
+    signed = neg | np.char.startswith(dstr, '+')
+    dstr   = np.where(signed, np.char.lstrip(dstr, '+-'), dstr)
+    valid  = (np.char.str_len(dms[..., 0]) - np.char.str_len(dstr)) == signed
+
+    # Every field has to be a number (missing minutes/seconds fields are zero, but only trailing ones)
+    # ...and only the last field can have a fractional part (e.g., "12:3.5:00" is not valid)
+    hasm  = dms[..., 1] == ':'
+    hass  = ms[..., 1] == ':'
+    valid = valid & isdecimal(dstr) & (~hasm | np.char.isdigit(dstr))
+    valid = valid & (~hasm | isdecimal(mstr)) & (~hass | (isdecimal(sstr) & np.char.isdigit(mstr)))
+    d = np.where(valid, dstr, '0').astype(np.float64)
+    m = np.where(valid & hasm, mstr, '0').astype(np.float64)
+    s = np.where(valid & hass, sstr, '0').astype(np.float64)
+
+    # Minutes and seconds have to be in the range [0, 60)
+    valid = valid & (m < 60.0) & (s < 60.0)
+
+    deg = (d + m / 60.0 + s / 3600.0) * np.where(neg, -1.0, 1.0)
+    if (unit == 'hour'): deg = deg * 15.0
+    valid = valid & inrange(deg, unit=unit)
+    deg[~valid] = np.nan
+    return deg, valid
+
+
+#====================================================================================================
+# Convert an array of sexagesimal strings to degrees
+def str2deg(values, unit='deg', verbose=True):
+    '''
+    Inputs:
+    -------
+    values  - Array of "hh:mm:ss.s" (unit='hour') or "dd:mm:ss.s" (unit='deg') strings
+    unit    - Unit of the first field in the strings ('hour' for RA, or 'deg' for DEC, see inrange())
+    verbose - Print the strings that could not be parsed
+
+    Outputs:
+    --------
+    Array of angles [degrees] (NaN for missing entries, i.e., 'nan' or '', and for unparseable entries)
+    '''
+    values = np.char.strip(np.asarray(values).astype(str))
+    deg, valid = parsesexagesimal(values=values, unit=unit)
+
+    # Hand the unrecognized strings over to astropy, one at a time (there should be very few of them)
+    ibad = np.where(~valid & (values != 'nan') & (values != ''))[0]
+    unparsed = []
+    for i in ibad:
+        try: deg[i] = astropydeg(values[i], unit=unit)
+        except Exception: unparsed.append(i)
+    if (verbose and len(unparsed) > 0):
+        print("Could not parse %d %s strings (set to NaN), e.g., %s" % (len(unparsed), unit, str(list(values[unparsed[:5]]))))
+    return deg
+
+
+#====================================================================================================
+# Convert arrays of RA/DEC strings to wrapped (RA, DEC, l, b) arrays in radians
+def radec2galactic(ra, dec, unit=(u.hour, u.deg), Nchunk=100000):
+    '''
+    Inputs:
+    -------
+    ra     - Array of right ascension strings in "hh:mm:ss.s" format (or floats, see unit)
+    dec    - Array of declination strings in "dd:mm:ss.s" format (or floats, see unit)
+    unit   - Units of ra and dec (use (u.deg, u.deg) for RA/DEC that are already in degrees)
+    Nchunk - Number of supernovae to transform at a time
+
+    Outputs:
+    --------
+    ra, dec, l, b - RA/DEC and Galactic longitude/latitude [radians]
+                    RA, l  : [-180, +180] degrees
+                    DEC, b : [ -90,  +90] degrees
+    '''
+    ra  = np.asarray(ra)
+    dec = np.asarray(dec)
+
+    # Parse RA/DEC strings ourselves, which is much faster than letting SkyCoord do it
+    if (unit == 'deg'): unit = (u.deg, u.deg)
+    strunits = ['hour' if (u.Unit(un) in [u.hour, u.hourangle]) else 'deg' for un in unit]
+    if (ra.dtype.kind in 'SU'):
+        ra   = str2deg(ra, unit=strunits[0])
+        unit = (u.deg, unit[1])
+    if (dec.dtype.kind in 'SU'):
+        dec  = str2deg(dec, unit=strunits[1])
+        unit = (unit[0], u.deg)
+
+    Nlines  = len(ra)
+    ra_deg  = np.zeros(Nlines)
+    dec_deg = np.zeros(Nlines)
+    l_deg   = np.zeros(Nlines)
+    b_deg   = np.zeros(Nlines)
+
+    # Collect the RA/DEC and Galactic (l,b) for each chunk of supernovae in units of [degrees]
+    for i0 in np.arange(0, Nlines, Nchunk):
+        i1 = min(i0 + Nchunk, Nlines)
+        radec  = coord.SkyCoord(ra[i0:i1], dec[i0:i1], unit=unit, frame='icrs')
+        lonlat = radec.transform_to('galactic')
+        ra_deg[i0:i1]  = radec.ra.deg
+        dec_deg[i0:i1] = radec.dec.deg
+        l_deg[i0:i1]   = lonlat.l.deg
+        b_deg[i0:i1]   = lonlat.b.deg
+
+    return wrapradians(ra_deg=ra_deg, dec_deg=dec_deg, l_deg=l_deg, b_deg=b_deg)
+
+
+#====================================================================================================
+# Bound RA/DEC and (l,b) to conform to our plotting coordinate range and convert to radians
+def wrapradians(ra_deg, dec_deg, l_deg, b_deg):
+    '''
+    Inputs:
+    -------
+    ra_deg, dec_deg - RA/DEC arrays [degrees]
+    l_deg, b_deg    - Galactic longitude/latitude arrays [degrees]
+
+    Outputs:
+    --------
+    ra, dec, l, b - Wrapped coordinates [radians]
+    '''
+    # RA  : [-180d:00m:00.0s, +180d:00m:00.0s]
+    # DEC : [ -90d:00m:00.0s,  +90d:00m:00.0s]
+    ra  = coord.Angle(ra_deg * u.degree).wrap_at(180.0 * u.degree).radian
+    dec = coord.Angle(dec_deg * u.degree).wrap_at(90.0 * u.degree).radian
+    l   = coord.Angle(l_deg * u.degree).wrap_at(180.0 * u.degree).radian
+    b   = coord.Angle(b_deg * u.degree).wrap_at(90.0 * u.degree).radian
+    return ra, dec, l, b
+
+
+#====================================================================================================
+# Check both RA/DEC parsers (str2deg(), with its astropy fallback) against astropy on the checkstrings fixture
+def checkparser(fixture=checkstrings, tolerance=1.0e-3):
+    '''
+    Inputs:
+    -------
+    fixture   - List of (string, unit, whether it is a valid angle)
+    tolerance - Largest allowed difference from astropy [milliarcseconds]
+
+    Outputs:
+    --------
+    passed - True if str2deg() accepts exactly the valid strings, agrees with astropy on them to within the
+             tolerance, and the fast parser alone does not accept any string that astropy rejects
+    '''
+    passed = True
+    print("")
+    for value, unit, expected in fixture:
+        fast, valid = parsesexagesimal(values=[value], unit=unit)
+        deg = str2deg(values=[value], unit=unit, verbose=False)[0]
+        try: ref = astropydeg(value, unit=unit)
+        except Exception: ref = np.nan
+        accepted = not np.isnan(deg)
+        ok = (accepted == expected) and (np.isnan(ref) != expected) and (not (valid[0] and np.isnan(ref)))
+        if (ok and accepted): ok = (np.abs(deg - ref) * 3.6e6 < tolerance)
+        if (not ok):
+            print("    FAIL: '%s' (unit='%s') parsed to %s, astropy gives %s, expected %s" % (value, unit, deg, ref, 'valid' if expected else 'invalid'))
+        passed = passed & ok
+    print("Checked %d RA/DEC strings against astropy (%s)" % (len(fixture), 'PASS' if passed else 'FAIL'))
+    return passed
+
+
+#====================================================================================================
+# Check the fast RA/DEC parser against astropy on the whole catalog and benchmark it
+def benchmark(fcsv, Nrepeat=3, tolerance=1.0e-3):
+    '''
+    Inputs:
+    -------
+    fcsv      - Filename for the Open Supernova Catalog CSV file
+    Nrepeat   - Number of times to parse the strings with each parser (the fastest time is reported)
+    tolerance - Largest allowed difference between the two parsers [milliarcseconds]
+
+    Outputs:
+    --------
+    agree - True if every string parsed by both parsers agrees to within the tolerance
+            and the fast parser does not accept any string that astropy rejects
+    '''
+    from readcatalog import readcatalog
+    from reducefields import splitfield
+    table = readcatalog(fcsv=fcsv, cols=['R.A.', 'Dec.'], dtypes={})
+
+    agree = True
+    print("")
+    for col, unit in [('R.A.', 'hour'), ('Dec.', 'deg')]:
+        values  = splitfield(table[col])[0]
+        values  = values[(values != 'nan') & (values != '')]
+        Nvalues = len(values)
+
+        # Parse every string with both parsers
+        t_fast    = []
+        t_astropy = []
+        for i in np.arange(Nrepeat):
+            t0 = time.time()
+            fast, valid = parsesexagesimal(values=values, unit=unit)
+            t_fast.append(time.time() - t0)
+            t0 = time.time()
+            slow = np.zeros(Nvalues) + np.nan
+            for j in np.arange(Nvalues):
+                try: slow[j] = astropydeg(values[j], unit=unit)
+                except Exception: pass
+            t_astropy.append(time.time() - t0)
+
+        # Compare the angles (in milliarcseconds) wherever both parsers succeeded
+        # ...and check that the fast parser never accepts a string that astropy rejects
+        both  = valid & ~np.isnan(slow)
+        dmas  = np.abs(fast[both] - slow[both]) * 3.6e6
+        dmax  = np.max(dmas) if (len(dmas) > 0) else 0.0
+        Nonly = np.sum(valid & np.isnan(slow))
+        agree = agree & (dmax < tolerance) & (Nonly == 0)
+        print("%s : %d strings" % (col, Nvalues))
+        print("    Parsed by both parsers          : %d" % np.sum(both))
+        print("    Rejected by the fast parser     : %d (handed to astropy)" % np.sum(~valid))
+        print("    Rejected by both parsers        : %d" % np.sum(~valid & np.isnan(slow)))
+        print("    Rejected only by astropy        : %d (%s)" % (Nonly, 'PASS' if (Nonly == 0) else 'FAIL'))
+        print("    Largest difference              : %.3g mas (%s)" % (dmax, 'PASS' if (dmax < tolerance) else 'FAIL'))
+        print("    parsesexagesimal()              : %.4f seconds (%.0f strings/s)" % (min(t_fast), Nvalues / min(t_fast)))
+        print("    astropy.coordinates.Angle()     : %.4f seconds (%.0f strings/s)" % (min(t_astropy), Nvalues / min(t_astropy)))
+        print("    Speed-up factor                 : %.1f\n" % (min(t_astropy) / min(t_fast)))
+    return agree
+
+
+if __name__ == "__main__":
+    passed = checkparser()
+    fcsv = "/Users/salvesen/outreach/asom/supernovae/data/The_Open_Supernova_Catalog.csv"
+    if (len(sys.argv) > 1): fcsv = sys.argv[1]
+    if (os.path.exists(fcsv)): passed = benchmark(fcsv=fcsv) & passed
+    sys.exit(0 if passed else 1)
@@ -0,0 +1,215 @@
+import json
+import numpy as np
+from parsedates import ymd2days, days2ymd
+from sndata import sncols, snkinds
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+try:
+    import pyarrow.compute as pc
+except ImportError:
+    pc = None  # pyarrow < 1.0 (see needpyarrow())
+
+'''
+Procedure:
+----------
+Write/read the organized supernovae data as columnar Arrow IPC (.arrow) or Parquet (.parquet) files.
+
+Output:
+-------
+A columnar file with the same columns as SNedata.h5 (see sndata.py), sorted chronologically.
+
+Notes:
+------
+The rows are grouped by discovery year: each year is its own Parquet row group (or Arrow IPC record batch),
+so a date window only touches the row groups/batches of the years it overlaps. The Parquet row groups carry
+min/max statistics that pyarrow uses to skip row groups, and the first/last day of each Arrow IPC record batch
+is stored in the schema metadata for the same purpose. The schema metadata also holds the summary statistics
+of mmax over the full dataset (like the root attributes of SNedata.h5).
+The dictionary-encoded columns ('host', 'type') are Arrow dictionary columns.
+Requires pyarrow >= 1.0 (for pyarrow.compute), which is optional (only needed for writing/reading these files).
+The row filters are plain boolean masks (Table.filter(mask)) and the Parquet row groups are skipped with the
+list-of-tuples filters of pq.read_table(), rather than with compute expressions (pyarrow >= 6 only).
+'''
+
+# Oldest pyarrow version that can write/read these files
+minpyarrow = (1, 0)
+
+# File extensions of the columnar formats
+arrowexts = {'.arrow': 'ipc', '.feather': 'ipc', '.parquet': 'parquet'}
+
+#====================================================================================================
+# Make sure pyarrow is available
+def needpyarrow():
+    if (pa == None):
+        raise ImportError("Reading/writing Arrow IPC or Parquet files requires pyarrow (pip install pyarrow)")
+    version = tuple(int(field) for field in pa.__version__.split('.')[:2])
+    if (version < minpyarrow):
+        raise ImportError("Reading/writing Arrow IPC or Parquet files requires pyarrow >= " + '.'.join(str(field) for field in minpyarrow)
+                          + ", found " + pa.__version__ + " (pip install --upgrade pyarrow)")
+
+
+#====================================================================================================
+# Columnar format of a file ('ipc' or 'parquet', None if it is not a columnar file)
+def arrowformat(fname):
+    for ext in arrowexts.keys():
+        if (str(fname).endswith(ext)): return arrowexts[ext]
+    return None
+
+
+#====================================================================================================
+# Arrow data type for each of the columns in the SNe data
+def arrowtype(key):
+    kind = snkinds[key]
+    if (kind == 'ascii'): return pa.string()
+    if (kind == 'dict'): return pa.dictionary(pa.int32(), pa.string())
+    if (kind == 'bool'): return pa.bool_()
+    return pa.from_numpy_dtype(np.dtype(kind))
+
+
+#====================================================================================================
+# Write the SNe data to an Arrow IPC or Parquet file with one row group (record batch) per year
+def writearrow(fout, data):
+    '''
+    Inputs:
+    -------
+    fout - Filename for the columnar file ('.arrow' or '.feather' for Arrow IPC, '.parquet' for Parquet)
+    data - Dictionary of arrays (keys are sncols, e.g., the output of sndata.readsndata()), sorted chronologically
+    '''
+    needpyarrow()
+    fmt = arrowformat(fout)
+    if (fmt == None): raise ValueError("Unknown columnar file extension for " + fout + ", use one of " + str(sorted(arrowexts.keys())))
+
+    # Build the table, one column at a time
+    arrays = []
+    for key in sncols:
+        values = np.asarray(data[key])
+        if (snkinds[key] in ['ascii', 'dict']): values = values.astype(str).astype(object)
+        else: values = values.astype(snkinds[key])
+        array = pa.array(values, type=arrowtype(key) if (snkinds[key] != 'dict') else pa.string())
+        if (snkinds[key] == 'dict'): array = array.dictionary_encode()
+        arrays.append(array)
+    table = pa.Table.from_arrays(arrays, names=sncols)
+
+    # Row offsets of each year of discoveries
+    days = np.asarray(data['days'], dtype=np.int64)
+    if (len(days) > 0): years = np.arange(days2ymd(days[0])[0], days2ymd(days[-1])[0] + 2)
+    else: years = np.array([], dtype=np.int64)
+    offsets = np.unique(np.searchsorted(days, ymd2days(years, 1, 1), side='left'))
+    groups  = [(int(i0), int(i1)) for i0, i1 in zip(offsets[:-1], offsets[1:]) if (i1 > i0)]
+
+    # Store the first/last day of each group and the summary statistics of mmax
+    meta = {'groupdays': json.dumps([[int(days[i0]), int(days[i1-1])] for i0, i1 in groups])}
+    mmax = np.asarray(data['mmax'], dtype=np.float64)
+    if (len(mmax) > 0):
+        meta['firstday'] = str(int(days[0]))
+        meta['lastday']  = str(int(days[-1]))
+        meta['mmax_mean'] = repr(float(np.mean(mmax)))
+        meta['mmax_std']  = repr(float(np.std(mmax)))
+        meta['mmax_min']  = repr(float(np.min(mmax)))
+        meta['mmax_max']  = repr(float(np.max(mmax)))
+    table = table.replace_schema_metadata(meta)
+
+    if (fmt == 'parquet'):
+        writer = pq.ParquetWriter(fout, table.schema)
+        for i0, i1 in groups:
+            writer.write_table(table.slice(i0, i1 - i0), row_group_size=i1 - i0)
+    else:
+        writer = pa.ipc.new_file(fout, table.schema)
+        for i0, i1 in groups:
+            writer.write_table(table.slice(i0, i1 - i0), max_chunksize=i1 - i0)
+    writer.close()
+
+
+#====================================================================================================
+# Collect the schema metadata of a columnar SNe data file
+def readarrowmeta(fin):
+    '''
+    Inputs:
+    -------
+    fin - Filename for the columnar file
+
+    Outputs:
+    --------
+    meta - Dictionary with 'firstday', 'lastday' [days since 1970/01/01], 'groupdays' (first/last day of each group),
+           and the summary statistics of mmax 'mmax_mean', 'mmax_std', 'mmax_min', 'mmax_max'
+    '''
+    needpyarrow()
+    if (arrowformat(fin) == 'parquet'): schema = pq.read_schema(fin)
+    else: schema = pa.ipc.open_file(pa.memory_map(fin, 'r')).schema
+    raw  = dict((key.decode('utf-8'), value.decode('utf-8')) for key, value in (schema.metadata or {}).items())
+    meta = {'groupdays': json.loads(raw.get('groupdays', '[]'))}
+    for key in ['firstday', 'lastday']:
+        if (key in raw): meta[key] = int(raw[key])
+    for key in ['mmax_mean', 'mmax_std', 'mmax_min', 'mmax_max']:
+        if (key in raw): meta[key] = float(raw[key])
+    return meta
+
+
+#====================================================================================================
+# Read some of the columns for the supernovae within a date window (and of some types)
+def readarrow(fin, keys=None, day0=None, dayf=None, types=None):
+    '''
+    Inputs:
+    -------
+    fin   - Filename for the columnar file
+    keys  - List of columns to read (None to read all of them)
+    day0  - First day of the window [days since 1970/01/01] (None for the first supernova)
+    dayf  - Last day of the window, inclusive [days since 1970/01/01] (None for the last supernova)
+    types - List of type classifications to keep (e.g., ['Ia', 'II'], None to keep all of them)
+
+    Outputs:
+    --------
+    data - Dictionary of arrays (strings, floats, etc.) like sndata.readsndata()
+    '''
+    needpyarrow()
+    if (keys == None): keys = list(sncols)
+
+    # Predicates on the discovery day and type
+    filters = []
+    if (day0 != None): filters.append(('days', '>=', int(day0)))
+    if (dayf != None): filters.append(('days', '<=', int(dayf)))
+    cols = list(keys)
+    for key, needed in [('days', len(filters) > 0), ('type', types != None)]:
+        if (needed and (key not in cols)): cols.append(key)
+
+    if (arrowformat(fin) == 'parquet'):
+        # pyarrow skips the row groups whose statistics rule them out
+        table = pq.read_table(fin, columns=cols, filters=filters if (len(filters) > 0) else None)
+    else:
+        # Only read the record batches (years) that overlap the window (memory-mapped, so nothing else is touched)
+        reader = pa.ipc.open_file(pa.memory_map(fin, 'r'))
+        groupdays = readarrowmeta(fin)['groupdays']
+        batches = []
+        for i in np.arange(reader.num_record_batches):
+            if ((day0 != None) and (groupdays[i][1] < day0)): continue
+            if ((dayf != None) and (groupdays[i][0] > dayf)): continue
+            batch = reader.get_batch(int(i))
+            batches.append(pa.RecordBatch.from_arrays([batch.column(batch.schema.get_field_index(col)) for col in cols], names=cols))
+        if (len(batches) > 0): table = pa.Table.from_batches(batches)
+        else: table = pa.Table.from_batches([], schema=pa.schema([reader.schema.field(col) for col in cols]))
+
+    # Keep only the supernovae within the window and of the types (the row groups/batches can extend beyond them)
+    if ((len(filters) > 0) or (types != None)):
+        keep = np.ones(table.num_rows, dtype=bool)
+        if (len(filters) > 0):
+            days = table.column('days').to_numpy()
+            if (day0 != None): keep = keep & (days >= day0)
+            if (dayf != None): keep = keep & (days <= dayf)
+        if (types != None):
+            sntype = np.array(pc.cast(table.column('type'), pa.string()).to_pylist(), dtype=str)
+            keep = keep & np.isin(sntype, np.asarray(list(types)).astype(str))
+        table = table.filter(pa.array(keep))
+
+    # Convert the columns into numpy arrays
+    data = {}
+    for key in keys:
+        column = table.column(key)
+        if (snkinds[key] in ['ascii', 'dict']):
+            values = pc.cast(column, pa.string()) if (snkinds[key] == 'dict') else column
+            data[key] = np.array(values.to_pylist(), dtype=str)
+        else:
+            data[key] = column.to_numpy()
+    return data
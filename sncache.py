@@ -0,0 +1,167 @@
+import os
+import hashlib
+import numpy as np
+from lrucache import evictlru
+
+'''
+Procedure:
+----------
+Cache the setup stage of the supernovae class (windowing, binning, classifying, and the stats) on disk, so that
+create_SNe_sonification.py and create_SNe_final_plot.py only pay for it once for the same SNe data and inputs.
+
+Output:
+-------
+One .npz file per session in a directory next to the SNe data file, holding the derived state of the
+supernovae instance (date bins, CSR bin layout, counts by type, stats, number of frames, ...).
+
+Notes:
+------
+A session is keyed on a hash of the contents of the SNe data file and on the inputs that the setup depends on
+(dates, NsubBeats, tempo, maxDuration, min/maxNstd, types, equalCount, and the chord progression), so changing
+any of them (or rewriting the data file) simply misses the cache, and the stale sessions are evicted later on.
+Hashing the contents of a large data file takes a while, so the content hash itself is remembered in the
+cache directory under the file name, size, and modification time (touching the file rehashes it once).
+The sessions are evicted, least recently used first, whenever they add up to more than the size budget.
+Bump sessionversion whenever the layout of the session changes, which misses every older session.
+
+Session:
+--------
+Arrays are stored as they are, datetimes (or lists of them) as datetime64[us], and other scalars as 0-d arrays.
+Values of None are not stored, so they come back as missing keys.
+'''
+
+# Version of the session layout (part of the key)
+sessionversion = 1
+
+# Size budget for the cached sessions [bytes]
+cachebudget = 256 * 1024**2
+
+# Size of the blocks that the data file is hashed in [bytes]
+Nblock = 16 * 1024**2
+
+#====================================================================================================
+# Default directory for the cached sessions (next to the SNe data file)
+def cachedirname(fdata):
+    return os.path.join(os.path.dirname(os.path.abspath(fdata)), 'sncache')
+
+
+#====================================================================================================
+# Hash of the contents of the SNe data file, remembered under its name, size, and modification time
+def filehash(fdata, cachedir):
+    '''
+    Inputs:
+    -------
+    fdata    - Filename for the SNe data
+    cachedir - Directory for the cached sessions
+
+    Outputs:
+    --------
+    digest - MD5 hex digest of the contents of fdata
+    '''
+    stat  = os.stat(fdata)
+    token = "%s|%d|%.6f" % (os.path.abspath(fdata), stat.st_size, stat.st_mtime)
+    fmemo = os.path.join(cachedir, "hash_%s.txt" % hashlib.md5(token.encode('utf-8')).hexdigest()[:12])
+    if (os.path.exists(fmemo)):
+        os.utime(fmemo, None)  # Mark it as recently used
+        with open(fmemo, 'r') as f: return f.read().strip()
+
+    md5 = hashlib.md5()
+    with open(fdata, 'rb') as f:
+        block = f.read(Nblock)
+        while (block):
+            md5.update(block)
+            block = f.read(Nblock)
+    digest = md5.hexdigest()
+    if (not os.path.exists(cachedir)): os.makedirs(cachedir)
+    # Write to a temporary file first, so that a remembered hash being read is never half written
+    ftmp = fmemo + '.%d.tmp' % os.getpid()
+    with open(ftmp, 'w') as f: f.write(digest + '\n')
+    os.rename(ftmp, fmemo)
+    return digest
+
+
+#====================================================================================================
+# Filename of the cached session for the SNe data and the inputs of the setup
+def sessionname(fdata, inputs, cachedir):
+    '''
+    Inputs:
+    -------
+    fdata    - Filename for the SNe data
+    inputs   - List of every input that the setup depends on (only its repr() is used)
+    cachedir - Directory for the cached sessions
+
+    Outputs:
+    --------
+    fsession - Filename of the session (e.g., 'sncache/session_0123456789ab.npz')
+    '''
+    token = "%d|%s|%s" % (sessionversion, filehash(fdata=fdata, cachedir=cachedir), repr(inputs))
+    return os.path.join(cachedir, "session_%s.npz" % hashlib.md5(token.encode('utf-8')).hexdigest()[:12])
+
+
+#====================================================================================================
+# Evict the least recently used sessions (and remembered hashes) until the cache fits within the size budget
+def evictsessions(cachedir, budget=cachebudget, keep=[]):
+    '''
+    Inputs:
+    -------
+    cachedir - Directory for the cached sessions
+    budget   - Size budget for the cached sessions [bytes]
+    keep     - List of filenames that should not be evicted
+
+    Outputs:
+    --------
+    evicted - List of the evicted filenames
+    '''
+    return evictlru(cachedir=cachedir, patterns=['session_*.npz', 'hash_*.txt'], budget=budget, keep=keep)
+
+
+#====================================================================================================
+# Write out a session
+def savesession(fsession, state, budget=cachebudget):
+    '''
+    Inputs:
+    -------
+    fsession - Filename of the session (output of sessionname())
+    state    - Dictionary of the derived state to cache (arrays, datetimes, lists of datetimes, or scalars)
+    budget   - Size budget for the cached sessions [bytes]
+    '''
+    arrays = {}
+    for key in state:
+        value = state[key]
+        if (value is None): continue
+        if ((type(value) == list) and (len(value) > 0) and hasattr(value[0], 'microsecond')):
+            value = np.array(value, dtype='datetime64[us]')
+        elif (hasattr(value, 'microsecond')):
+            value = np.datetime64(value, 'us')
+        arrays[key] = np.asarray(value)
+    cachedir = os.path.dirname(fsession)
+    if (not os.path.exists(cachedir)): os.makedirs(cachedir)
+    # Write to a temporary file first, so that a session being read is never half written
+    ftmp = fsession + '.%d.tmp' % os.getpid()
+    with open(ftmp, 'wb') as f: np.savez(f, **arrays)
+    os.rename(ftmp, fsession)
+    evictsessions(cachedir=cachedir, budget=budget, keep=[fsession])
+
+
+#====================================================================================================
+# Read in a session
+def loadsession(fsession):
+    '''
+    Inputs:
+    -------
+    fsession - Filename of the session (output of sessionname())
+
+    Outputs:
+    --------
+    state - Dictionary of the derived state (see savesession()), or None if the session is not cached
+    '''
+    if (not os.path.exists(fsession)): return None
+    os.utime(fsession, None)  # Mark it as recently used
+    state = {}
+    with np.load(fsession) as arrays:
+        for key in arrays.files:
+            value = arrays[key]
+            if (value.dtype.kind == 'M'): value = value.astype('datetime64[us]').tolist()
+            elif (value.ndim == 0): value = value.item()
+            state[key] = value
+    return state
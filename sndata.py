@@ -0,0 +1,667 @@
+import os
+import sys
+import json
+import zlib
+import numpy as np
+import h5py
+from parsedates import parsedates, ymd2days, days2ymd
+
+'''
+Procedure:
+----------
+Read/write the organized supernovae data (SNedata.h5), either all at once or incrementally.
+
+Schema (version 4):
+-------------------
+All datasets have one entry per supernova, sorted chronologically by 'time' (and 'days'), and are chunked,
+gzip-compressed, and resizable. The root attributes hold the schema 'version' and the summary statistics
+of mmax over the full dataset ('mmax_mean', 'mmax_std', 'mmax_min', 'mmax_max'), so that readers
+do not need to load the whole mmax column just to get them.
+    'ascii'   - Fixed-width byte strings (name, date, z)
+    'dict'    - Dictionary-encoded strings: integer codes (uint8/uint16/...) in the dataset itself,
+                plus the lookup table of unique strings in the dataset '<key>_lookup' (host, type)
+    'float32' - RA, DEC, l, b [radians] (float32 is ~0.01 arcsec precision, plenty for plotting)
+    'int64'   - Discovery dates as day numbers (days since 1970/01/01, see parsedates.py)
+The dataset 'yearindex' holds, for each year from its 'year0' attribute onward, the index of the first
+supernova discovered in that year (plus a final entry for the end), so findwindow() can locate any date
+window with a binary search over a small slab of 'days', and readsndata() can read just that window.
+The datasets 'daycounts' [Ndays, len(sntypes)] and 'dayoffsets' [Ndays+1] hold, for each day from their 'day0'
+attribute (the first discovery) through the last discovery, the number of supernovae of each simplified type
+and the index of the first supernova discovered on that day (plus a final entry for the end). The number of
+supernovae (of each type) in any bins of whole days then comes from cumulative sums without reading 'days'
+(see readdaycounts() and groupdates.rebincounts()).
+Use readsndata() to read any subset of the columns (decoded back into strings/floats).
+Files written with the old schema (plain datasets, no 'version' attribute) can still be read.
+
+Notes:
+------
+Every supernova is keyed on its (first) 'Name' entry and fingerprinted with a hash of its raw catalog row.
+When the catalog is refreshed, only the rows whose fingerprint is new need to be processed by organizedata.py,
+and mergesndata() then splices them into the time-sorted datasets in place (rows that changed or disappeared
+from the catalog are removed). Only the part of each dataset after the earliest change is rewritten.
+The datasets are sorted by day, then by name (see sortorder()), in both cases, so the supernovae discovered on
+the same day are in the same order after an incremental update as after a full rebuild.
+Catalog rows that never make it through the filters in organizedata.py (e.g., no RA/DEC) or that are rejected
+by the burst/duplicate screening are not stored in the SNe data file. They are kept in the screening ledger next
+to it instead (e.g., SNedata_screen.npz, see writescreen()), which holds every catalog row that organizedata.py
+processed, with what the burst/duplicate screening needs (days, RA/DEC in degrees) and the outcome of its last
+screening. So those rows are not processed again, and the screening can be rerun over the whole (ledger + new)
+catalog to match a full rebuild.
+
+The missing mmax values are filled in with the mean of the full dataset, which changes when rows are added,
+so the mask of filled-in values is stored too ('mmax_filled') and they are refilled after every merge.
+
+Sidecar:
+--------
+Every time the SNe data file is written, the columns needed for plotting/sonifying (sidecarcols) are also
+written to a fixed-layout structured .npy file next to it (e.g., SNedata.npy), with one record per supernova.
+opensidecar() opens it with np.memmap, so nothing is decompressed or copied until it is used and every process
+reading it shares the same page-cached copy. readdaybounds(), findwindow() and readsndata() use it when given.
+'''
+
+# Schema version written to the root attributes of the SNe data file
+snversion = 4
+
+# Datasets in the SNe data file and how each one is stored
+snschema = [('time', 'float64'), ('days', 'int64'), ('name', 'ascii'), ('date', 'ascii'), ('mmax', 'float64'),
+            ('host', 'dict'), ('ra', 'float32'), ('dec', 'float32'), ('l', 'float32'), ('b', 'float32'),
+            ('z', 'ascii'), ('type', 'dict'), ('mmax_filled', 'bool'), ('rowhash', 'uint32')]
+sncols   = [key for key, kind in snschema]
+snkinds  = dict(snschema)
+
+# Columns in the memory-mapped sidecar of the SNe data file
+sidecarcols = ['days', 'date', 'mmax', 'ra', 'dec', 'l', 'b', 'type']
+
+# Simplified type classifications (their order sets the type codes, see typecodes())
+sntypes = ['Ia', 'II', 'Other', 'Unknown']
+
+# Arrays in the screening ledger of the SNe data file (see writescreen())
+screencols = ['name', 'date', 'rowhash', 'days', 'ra', 'dec', 'reason']
+
+# Chunking and compression for all of the datasets
+chunksize = 16384
+h5opts    = {'compression': 'gzip', 'compression_opts': 4, 'shuffle': True}
+
+#====================================================================================================
+# Fingerprint each row of the catalog
+def rowhashes(table, cols=None):
+    '''
+    Inputs:
+    -------
+    table - Dictionary of catalog columns (output of readcatalog.readcatalog())
+    cols  - Columns to include in the fingerprint (default is all of them, in sorted order)
+
+    Outputs:
+    --------
+    rowhash - Array of CRC32 checksums of the raw catalog rows (uint32)
+    '''
+    if (cols == None): cols = sorted(table.keys())
+    rows = np.asarray(table[cols[0]]).astype(str).astype(object)
+    for col in cols[1:]:
+        rows = rows + '|' + np.asarray(table[col]).astype(str).astype(object)
+    rowhash = np.zeros(len(rows), dtype=np.uint32)
+    for i, row in enumerate(rows):
+        if (not isinstance(row, bytes)): row = row.encode('utf-8')
+        rowhash[i] = zlib.crc32(row) & 0xffffffff
+    return rowhash
+
+
+#====================================================================================================
+# Convert strings read from an HDF5 file (bytes or objects) into a numpy string array
+def h5str(values):
+    values = np.asarray(values)
+    if (values.dtype.kind == 'U'): return values
+    if (sys.version_info[0] < 3): return values.astype(str)
+    return np.char.decode(values.astype(bytes), 'utf-8')
+
+
+#====================================================================================================
+# Combine the names and fingerprints into a single key for set operations
+def rowkeys(name, rowhash):
+    return np.char.add(np.char.add(np.asarray(name).astype(str), '|'), np.asarray(rowhash).astype(str))
+
+
+#====================================================================================================
+# Order of the supernovae in the SNe data file: chronological, with the ties broken by name (then fingerprint)
+# ...Both organizedata.py and mergesndata() sort with this, so an incremental update matches a full rebuild row for row
+def sortorder(days, name, rowhash):
+    return np.lexsort((np.asarray(rowhash), np.asarray(name).astype(str), np.asarray(days)))
+
+
+#====================================================================================================
+# Smallest unsigned integer type that can hold Ncodes dictionary codes
+def codedtype(Ncodes):
+    for dtype in [np.uint8, np.uint16, np.uint32]:
+        if (Ncodes <= np.iinfo(dtype).max + 1): return dtype
+    return np.uint64
+
+
+#====================================================================================================
+# Convert an array of values into its stored form (updating the lookup table of dictionary-encoded columns)
+def encodecol(f, key, values):
+    '''
+    Inputs:
+    -------
+    f      - Open (writable) SNe data file
+    key    - Name of the dataset
+    values - Array of values (strings for the 'ascii' and 'dict' columns)
+
+    Outputs:
+    --------
+    Array to store in the dataset
+    '''
+    kind = snkinds[key]
+    if (kind == 'ascii'):
+        values = np.asarray(values).astype(str)
+        if (len(values) == 0): return np.array([], dtype='S1')
+        return np.char.encode(values, 'utf-8')
+    if (kind == 'dict'):
+        values = np.asarray(values).astype(str)
+        lkey   = key + '_lookup'
+        if (lkey in f): lookup = h5str(f[lkey][:])
+        else: lookup = np.array([], dtype=str)
+
+        # Append any new strings to the lookup table (existing codes never change)
+        uniq, inverse = np.unique(values, return_inverse=True)
+        new = uniq[~np.isin(uniq, lookup)]
+        if ((len(new) > 0) or (lkey not in f)):
+            lookup = np.concatenate([lookup, new]).astype(str)
+            if (lkey in f): del f[lkey]
+            f.create_dataset(lkey, data=lookup.astype(object), dtype=h5py.special_dtype(vlen=str))
+
+        # Map the unique strings to their codes
+        index  = dict((value, i) for i, value in enumerate(lookup))
+        ucodes = np.array([index[value] for value in uniq], dtype=np.int64)
+        return ucodes[np.ravel(inverse)].astype(codedtype(len(lookup)))
+    return np.asarray(values).astype(kind)
+
+
+#====================================================================================================
+# Read (part of) a dataset and decode it into strings/numbers
+def decodecol(f, key, i0=None, i1=None):
+    '''
+    Inputs:
+    -------
+    f      - Open SNe data file
+    key    - Name of the dataset
+    i0, i1 - Range of supernovae to read (None to read everything)
+
+    Outputs:
+    --------
+    Array of decoded values
+    '''
+    values = f[key][i0:i1]
+    if ((key + '_lookup') in f): return h5str(f[key + '_lookup'][:])[values]
+    if (values.dtype.kind in 'SOU'): return h5str(values)
+    return values
+
+
+#====================================================================================================
+# Create a chunked, compressed, resizable dataset in an open SNe data file
+def createcol(f, key, stored):
+    chunks = (min(max(len(stored), 1), chunksize),)
+    f.create_dataset(key, data=stored, maxshape=(None,), chunks=chunks, **h5opts)
+
+
+#====================================================================================================
+# Store the summary statistics of mmax in the root attributes
+def writestats(f):
+    mmax = f['mmax'][:]
+    if (len(mmax) == 0): return
+    f.attrs['Nsne']      = len(mmax)
+    f.attrs['mmax_mean'] = np.mean(mmax)  # Mean apparent AB magnitude
+    f.attrs['mmax_std']  = np.std(mmax)   # Standard deviation in the apparent AB magnitude
+    f.attrs['mmax_min']  = np.min(mmax)   # Brightest apparent AB magnitude
+    f.attrs['mmax_max']  = np.max(mmax)   # Dimmest apparent AB magnitude
+
+
+#====================================================================================================
+# Store the per-year offsets index into the (chronologically sorted) datasets
+def writeindex(f):
+    days = f['days'][:]
+    if ('yearindex' in f): del f['yearindex']
+    if (len(days) == 0): return
+    years   = np.arange(days2ymd(days[0])[0], days2ymd(days[-1])[0] + 2)
+    offsets = np.searchsorted(days, ymd2days(years, 1, 1), side='left')
+    f.create_dataset('yearindex', data=offsets.astype(np.int64))
+    f['yearindex'].attrs['year0'] = years[0]
+
+
+#====================================================================================================
+# Simplified type classification codes (index into sntypes) of an array of type classifications
+def typecodes(type):
+    '''
+    Inputs:
+    -------
+    type - Array of type classifications (e.g., 'Ia', 'II', 'Ib/c', 'nan')
+
+    Outputs:
+    --------
+    codes - Array of codes (uint8): 0 for 'Ia', 1 for 'II', 3 for 'nan' (Unknown), and 2 for everything else (Other)
+    '''
+    type  = np.asarray(type).astype(str)
+    codes = np.full(type.shape, sntypes.index('Other'), dtype=np.uint8)
+    codes[type == 'Ia']  = sntypes.index('Ia')
+    codes[type == 'II']  = sntypes.index('II')
+    codes[type == 'nan'] = sntypes.index('Unknown')
+    return codes
+
+
+#====================================================================================================
+# Store the number of supernovae of each type per day and the per-day offsets into the datasets
+def writedaycounts(f):
+    days = f['days'][:]
+    for key in ['daycounts', 'dayoffsets']:
+        if (key in f): del f[key]
+    if (len(days) == 0): return
+
+    # Classify the (few) unique types, then look up the code of every supernova
+    codes   = typecodes(h5str(f['type_lookup'][:]))[f['type'][:]]
+    day0    = int(days[0])
+    Ndays   = int(days[-1]) - day0 + 1
+    counts  = np.bincount((days - day0) * len(sntypes) + codes, minlength=Ndays * len(sntypes))
+    offsets = np.searchsorted(days, day0 + np.arange(Ndays + 1), side='left')
+    f.create_dataset('daycounts', data=counts.reshape(Ndays, len(sntypes)).astype(np.int32), **h5opts)
+    f.create_dataset('dayoffsets', data=offsets.astype(np.int64), **h5opts)
+    f['daycounts'].attrs['day0']  = day0
+    f['daycounts'].attrs['types'] = ','.join(sntypes)
+
+
+#====================================================================================================
+# Collect the number of supernovae of each type per day and the per-day offsets (None if the file does not have them)
+def readdaycounts(fh5, day0=None, dayf=None):
+    '''
+    Inputs:
+    -------
+    fh5  - Filename for the SNe data
+    day0 - First day to read [days since 1970/01/01] (None for the first discovery)
+    dayf - Last day to read, inclusive [days since 1970/01/01] (None for the last discovery)
+
+    Outputs:
+    --------
+    cube - Dictionary with 'day0' (day of the first row), 'counts' (number of supernovae of each of the sntypes
+           on each day, [Ndays, len(sntypes)]), and 'offsets' (index of the first supernova on each day, plus the end,
+           [Ndays+1]), or None
+    '''
+    f = h5py.File(fh5, 'r')
+    if (('daycounts' not in f) or (f['daycounts'].attrs.get('types', '') != ','.join(sntypes))):
+        f.close()
+        return None
+    first = int(f['daycounts'].attrs['day0'])
+    Ndays = f['daycounts'].shape[0]
+    j0, j1 = 0, Ndays
+    if (day0 != None): j0 = int(np.clip(np.floor(day0) - first, 0, Ndays))
+    if (dayf != None): j1 = int(np.clip(np.floor(dayf) - first + 1, j0, Ndays))
+    cube = {'day0': first + j0, 'counts': f['daycounts'][j0:j1], 'offsets': f['dayoffsets'][j0:j1+1]}
+    f.close()
+    return cube
+
+
+#====================================================================================================
+# Read (part of) the day numbers, parsing the dates for files that do not have them
+def readdays(f, i0=None, i1=None):
+    if ('days' in f): return f['days'][i0:i1]
+    return parsedates(date=h5str(f['date'][i0:i1]))[0]
+
+
+#====================================================================================================
+# Find the range of supernovae discovered within a date window
+def findwindow(fh5, day0=None, dayf=None, sidecar=None):
+    '''
+    Inputs:
+    -------
+    fh5     - Filename for the SNe data
+    day0    - First day of the window [days since 1970/01/01] (None for the first supernova)
+    dayf    - Last day of the window, inclusive [days since 1970/01/01] (None for the last supernova)
+    sidecar - Memory-mapped sidecar of the SNe data file (output of opensidecar(), None to use the HDF5 file)
+
+    Outputs:
+    --------
+    i0, i1 - Index range [i0, i1) of the supernovae in the window
+    '''
+    # Binary search straight through the memory-mapped day numbers (only ~log2(N) pages are touched)
+    if (sidecar is not None):
+        i0, i1 = 0, len(sidecar)
+        if (day0 != None): i0 = np.searchsorted(sidecar['days'], day0, side='left')
+        if (dayf != None): i1 = np.searchsorted(sidecar['days'], dayf, side='right')
+        return int(i0), int(max(i0, i1))
+
+    f = h5py.File(fh5, 'r')
+    N = f['time'].shape[0]
+
+    # Use the year index to narrow down the slab of day numbers to search
+    j0, j1 = 0, N
+    if ('yearindex' in f):
+        offsets = f['yearindex'][:]
+        year0   = int(f['yearindex'].attrs['year0'])
+        Nyears  = len(offsets) - 1
+        if (day0 != None): j0 = offsets[int(np.clip(days2ymd(int(np.floor(day0)))[0] - year0, 0, Nyears))]
+        if (dayf != None): j1 = offsets[int(np.clip(days2ymd(int(np.floor(dayf)))[0] - year0 + 1, 0, Nyears))]
+    slab = readdays(f=f, i0=j0, i1=max(j0, j1))
+    f.close()
+
+    # Binary search within the slab
+    i0, i1 = j0, j0 + len(slab)
+    if (day0 != None): i0 = j0 + np.searchsorted(slab, day0, side='left')
+    if (dayf != None): i1 = j0 + np.searchsorted(slab, dayf, side='right')
+    return int(i0), int(max(i0, i1))
+
+
+#====================================================================================================
+# Collect the first and last discovery dates in the SNe data file
+def readdaybounds(fh5, sidecar=None):
+    '''
+    Inputs:
+    -------
+    fh5     - Filename for the SNe data
+    sidecar - Memory-mapped sidecar of the SNe data file (output of opensidecar(), None to use the HDF5 file)
+
+    Outputs:
+    --------
+    firstday, lastday - Day numbers of the first and last supernovae [days since 1970/01/01]
+    '''
+    if (sidecar is not None): return sidecar['days'][0], sidecar['days'][-1]
+    f = h5py.File(fh5, 'r')
+    N = f['time'].shape[0]
+    firstday = readdays(f=f, i0=0, i1=1)[0]
+    lastday  = readdays(f=f, i0=N-1, i1=N)[0]
+    f.close()
+    return firstday, lastday
+
+
+#====================================================================================================
+# Collect the summary statistics of mmax (None if the file does not have them)
+def readstats(fh5):
+    '''
+    Inputs:
+    -------
+    fh5 - Filename for the SNe data
+
+    Outputs:
+    --------
+    stats - Dictionary with 'mmax_mean', 'mmax_std', 'mmax_min', 'mmax_max' (or None)
+    '''
+    f = h5py.File(fh5, 'r')
+    if ('mmax_mean' not in f.attrs):
+        f.close()
+        return None
+    stats = {}
+    for key in ['mmax_mean', 'mmax_std', 'mmax_min', 'mmax_max']:
+        stats[key] = float(f.attrs[key])
+    f.close()
+    return stats
+
+
+#====================================================================================================
+# Read some (or all) of the columns from the SNe data file
+def readsndata(fh5, keys=None, i0=None, i1=None, sidecar=None):
+    '''
+    Inputs:
+    -------
+    fh5     - Filename for the SNe data
+    keys    - List of datasets to read (None to read all of them)
+    i0, i1  - Range of supernovae to read (None to read everything)
+    sidecar - Memory-mapped sidecar of the SNe data file (output of opensidecar(), None to use the HDF5 file)
+              (only used if all of the keys are in the sidecar)
+
+    Outputs:
+    --------
+    data - Dictionary of decoded arrays
+    '''
+    if ((sidecar is not None) and (keys != None) and np.all(np.isin(keys, sidecarcols))):
+        records = sidecar[i0:i1]
+        data = {}
+        for key in keys:
+            if (records[key].dtype.kind == 'S'): data[key] = h5str(records[key])
+            else: data[key] = np.array(records[key])
+        return data
+
+    f = h5py.File(fh5, 'r')
+    if (keys == None): keys = [key for key in sncols if ((key in f) or (key == 'days'))]
+    data = {}
+    for key in keys:
+        if (key == 'days'): data[key] = readdays(f=f, i0=i0, i1=i1)
+        else: data[key] = decodecol(f=f, key=key, i0=i0, i1=i1)
+    f.close()
+    return data
+
+
+#====================================================================================================
+# Collect the names and fingerprints of the supernovae already in the SNe data file
+def readkeys(fh5):
+    '''
+    Inputs:
+    -------
+    fh5 - Filename for the SNe data
+
+    Outputs:
+    --------
+    name, rowhash - Arrays of the supernova names and fingerprints (None if the file has no fingerprints)
+    '''
+    f = h5py.File(fh5, 'r')
+    if ('rowhash' not in f):
+        f.close()
+        return None, None
+    name    = h5str(f['name'][:])
+    rowhash = f['rowhash'][:]
+    f.close()
+    return name, rowhash
+
+
+#====================================================================================================
+# Filename of the screening ledger for an SNe data file
+def screenname(fh5):
+    return os.path.splitext(fh5)[0] + '_screen.npz'
+
+
+#====================================================================================================
+# Write out the screening ledger (every processed catalog row, and the outcome of its screening)
+def writescreen(fh5, screen, settings):
+    '''
+    Inputs:
+    -------
+    fh5      - Filename for the SNe data (write the SNe data first, the ledger is tied to it)
+    screen   - Dictionary of arrays (keys are screencols): the first 'name' entry and raw 'date' strings, 'rowhash',
+               'days', 'ra'/'dec' [degrees], and 'reason' (index into filterbursts.screenreasons), in catalog order
+    settings - Dictionary of the ingest settings that the screening depends on (strings/numbers)
+
+    Outputs:
+    --------
+    A compressed .npz file next to fh5 (e.g., SNedata_screen.npz)
+    '''
+    # Tie the ledger to the SNe data file it was written with
+    f = h5py.File(fh5, 'r')
+    Nsne = len(f['name'])
+    f.close()
+    arrays = {'settings': np.array(json.dumps(settings, sort_keys=True)), 'Nsne': np.array(Nsne)}
+    for key in screencols: arrays[key] = np.asarray(screen[key])
+
+    # The whole ledger changes with every update (it is in catalog order), so it is rewritten as a separate file
+    # ...rather than in place in the HDF5 file, which would not reuse the space of the old one
+    # ...Write to a temporary file first, so that a ledger being read is never half written
+    fscreen = screenname(fh5)
+    ftmp    = fscreen + '.%d.tmp' % os.getpid()
+    with open(ftmp, 'wb') as fout: np.savez_compressed(fout, **arrays)
+    os.rename(ftmp, fscreen)
+
+
+#====================================================================================================
+# Read in the screening ledger
+def readscreen(fh5):
+    '''
+    Inputs:
+    -------
+    fh5 - Filename for the SNe data
+
+    Outputs:
+    --------
+    screen, settings - See writescreen() (None, None if there is no screening ledger for the current SNe data file)
+    '''
+    fscreen = screenname(fh5)
+    if (not os.path.exists(fscreen)): return None, None
+    f = h5py.File(fh5, 'r')
+    Nsne = len(f['name'])
+    f.close()
+    with np.load(fscreen) as arrays:
+        if (int(arrays['Nsne']) != Nsne): return None, None  # Written with another version of the SNe data file
+        screen   = dict((key, arrays[key]) for key in screencols)
+        settings = json.loads(str(arrays['settings']))
+    return screen, settings
+
+
+#====================================================================================================
+# Write out all of the SNe data from scratch
+def writesndata(fh5, data):
+    '''
+    Inputs:
+    -------
+    fh5  - Filename for the SNe data
+    data - Dictionary of arrays (keys are sncols), sorted chronologically (see sortorder())
+    '''
+    f = h5py.File(fh5, 'w')
+    f.attrs['version'] = snversion
+    for key in sncols:
+        createcol(f=f, key=key, stored=encodecol(f=f, key=key, values=data[key]))
+    writestats(f)
+    writeindex(f)
+    writedaycounts(f)
+    f.close()
+    writesidecar(fh5=fh5)
+
+
+#====================================================================================================
+# Merge new/changed SNe data into the existing SNe data file
+def mergesndata(fh5, data, dropnames):
+    '''
+    Inputs:
+    -------
+    fh5       - Filename for the SNe data
+    data      - Dictionary of arrays (keys are sncols) for the new/changed supernovae, in any order
+                (set to None if there are no new/changed supernovae)
+    dropnames - Names of the supernovae to remove (changed or no longer in the catalog)
+
+    Outputs:
+    --------
+    Nadded, Ndropped - Number of supernovae added and removed
+    '''
+    # Files written with an older schema are converted to the current one first
+    f = h5py.File(fh5, 'r')
+    version = f.attrs.get('version', 1)
+    f.close()
+    if (version != snversion): writesndata(fh5=fh5, data=readsndata(fh5=fh5))
+
+    f     = h5py.File(fh5, 'r+')
+    name  = h5str(f['name'][:])
+    Nold  = len(name)
+    idrop = np.where(np.isin(name, np.asarray(dropnames).astype(str)))[0]
+    ikeep = np.setdiff1d(np.arange(Nold), idrop)
+
+    # Where the new supernovae go among the kept ones, in the same order as a full rebuild (see sortorder())
+    # ...iorder is into the kept supernovae followed by the new ones
+    if (data == None): Nadd = 0
+    else: Nadd = len(data['time'])
+    days     = f['days'][:][ikeep]
+    rowhash  = f['rowhash'][:][ikeep]
+    keptname = name[ikeep]
+    if (Nadd > 0):
+        days     = np.concatenate([days, np.asarray(data['days'], dtype=days.dtype)])
+        rowhash  = np.concatenate([rowhash, np.asarray(data['rowhash'], dtype=rowhash.dtype)])
+        keptname = np.concatenate([keptname, np.asarray(data['name']).astype(str)])
+    iorder = sortorder(days=days, name=keptname, rowhash=rowhash)
+
+    # Nothing before the earliest removal/reordering/insertion changes, so only read and rewrite from there onward
+    # ...(the kept supernovae before i0 are the same ones, in the same place, as in the file)
+    Nnew  = len(ikeep) + Nadd
+    imove = np.where(iorder != np.arange(Nnew))[0]
+    i0 = Nold
+    if (len(idrop) > 0): i0 = min(i0, idrop[0])
+    if (len(imove) > 0): i0 = min(i0, imove[0])
+    for key in sncols:
+        tail = decodecol(f=f, key=key, i0=i0)
+        if (tail.dtype.kind == 'U'): tail = tail.astype(object)  # Do not truncate longer strings
+        tail = np.delete(tail, idrop - i0)
+        if (Nadd > 0):
+            new = np.asarray(data[key])
+            if (tail.dtype.kind == 'O'): new = new.astype(str).astype(object)
+            tail = np.concatenate([tail, new.astype(tail.dtype)])
+        tail   = tail[iorder[i0:] - i0]
+        stored = encodecol(f=f, key=key, values=tail)
+
+        # Widen the dataset if the strings got longer or there are more dictionary codes
+        dtype = np.promote_types(f[key].dtype, stored.dtype)
+        if (dtype == f[key].dtype):
+            f[key].resize((Nnew,))
+            if (i0 < Nnew): f[key][i0:] = stored
+        else:
+            head = f[key][:i0].astype(dtype)
+            del f[key]
+            createcol(f=f, key=key, stored=np.concatenate([head, stored.astype(dtype)]))
+
+    # Refill the missing mmax values with the mean of the merged dataset
+    # ...the same population and expression that organizedata.py fills them with, so this matches a full rebuild
+    mmax   = f['mmax'][:]
+    filled = f['mmax_filled'][:]
+    if (np.any(filled) and np.any(~filled)):
+        mmax[filled] = np.mean(mmax[~filled])
+        f['mmax'][:] = mmax
+    writestats(f)
+    writeindex(f)
+    writedaycounts(f)
+    f.close()
+    writesidecar(fh5=fh5)
+    return Nadd, len(idrop)
+
+
+#====================================================================================================
+# Filename of the memory-mapped sidecar for an SNe data file
+def sidecarname(fh5):
+    return os.path.splitext(fh5)[0] + '.npy'
+
+
+#====================================================================================================
+# Write the plotting columns of the SNe data file to a fixed-layout, memory-mappable .npy file
+def writesidecar(fh5):
+    '''
+    Inputs:
+    -------
+    fh5 - Filename for the SNe data
+
+    Outputs:
+    --------
+    A structured .npy file (one record per supernova, with fields sidecarcols) next to fh5
+    '''
+    data = readsndata(fh5=fh5, keys=sidecarcols)
+    for key in sidecarcols:
+        if (data[key].dtype.kind == 'U'): data[key] = np.char.encode(data[key], 'utf-8')
+    dtype   = [(key, data[key].dtype if (data[key].dtype.itemsize > 0) else 'S1') for key in sidecarcols]
+    records = np.zeros(len(data['days']), dtype=dtype)
+    for key in sidecarcols:
+        records[key] = data[key]
+    np.save(sidecarname(fh5), records)
+
+
+#====================================================================================================
+# Open the memory-mapped sidecar of the SNe data file
+def opensidecar(fh5):
+    '''
+    Inputs:
+    -------
+    fh5 - Filename for the SNe data
+
+    Outputs:
+    --------
+    Read-only np.memmap of the sidecar records (None if there is no up-to-date sidecar)
+    '''
+    fnpy = sidecarname(fh5)
+    if (not os.path.exists(fnpy)): return None
+    if (os.path.getmtime(fnpy) < os.path.getmtime(fh5)): return None
+
+    # Read the small .npy header to find the layout of the records
+    fobj = open(fnpy, 'rb')
+    version = np.lib.format.read_magic(fobj)
+    if (version == (1, 0)): shape, fortran, dtype = np.lib.format.read_array_header_1_0(fobj)
+    else: shape, fortran, dtype = np.lib.format.read_array_header_2_0(fobj)
+    offset = fobj.tell()
+    fobj.close()
+    if ((len(shape) != 1) or (shape[0] == 0) or (list(dtype.names) != sidecarcols)): return None
+    return np.memmap(fnpy, dtype=dtype, mode='r', offset=offset, shape=shape)